@@ -3,27 +3,30 @@ import os
 import warnings
 import logging
 import streamlit as st
-import tempfile
-import requests
-from PIL import Image
-import pytesseract
-from bs4 import BeautifulSoup
 import json
-import base64
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
+import csv
 import io
+import copy
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import re
 import random
 import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from operator import itemgetter
+from db import connect, create_extraction_cache_table, create_invoice_tables, get_conn, migrate_items_gst_pct
 
-# LangChain imports
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.document_loaders import PyPDFLoader
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Heavy dependencies (ReportLab, LangChain, PIL, pytesseract) are imported
+# inside the functions that use them to keep cold start fast
 from dotenv import load_dotenv
 
 # Configuration
@@ -32,48 +35,167 @@ warnings.filterwarnings("ignore")
 logging.getLogger("transformers").setLevel(logging.ERROR)
 
 # ==================== DATABASE FUNCTIONS ====================
+@st.cache_resource
 def get_db_connection():
-    """Get SQLite database connection"""
-    return sqlite3.connect("database.db")
+    """Get shared SQLite database connection (opened once per process)"""
+    conn = connect()
+
+    # Tune for a read-heavy lookup workload
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=134217728")
+    conn.execute("PRAGMA busy_timeout=60000")
 
-def get_all_categories():
-    """Get all categories from database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT category FROM items ORDER BY category")
-        categories = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return categories
-    except Exception as e:
-        st.error(f"Database error: {e}")
-        return []
+        create_invoice_tables(conn)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logging.getLogger(__name__).warning("Could not create invoice draft tables: %s", e)
 
-def get_items_by_category(category):
-    """Get items by category from database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT item_name, hsn_code, rate_of_gst FROM items WHERE category = ? ORDER BY item_name", (category,))
-        items = cursor.fetchall()
-        conn.close()
-        return items
-    except Exception as e:
-        st.error(f"Database error: {e}")
-        return []
+        create_extraction_cache_table(conn)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logging.getLogger(__name__).warning("Could not create extraction cache table: %s", e)
 
-def get_item_details(item_name):
-    """Get HSN code and GST rate for specific item"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT hsn_code, rate_of_gst FROM items WHERE item_name = ?", (item_name,))
-        result = cursor.fetchone()
-        conn.close()
-        return result if result else (None, None)
+        migrate_items_gst_pct(conn)
+
+        # Index the lookup columns so category/item queries avoid full table scans
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_items_category ON items(category, item_name)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_items_name_cov ON items(item_name, hsn_code, rate_of_gst)")
+        conn.execute("ANALYZE")
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logging.getLogger(__name__).warning("Could not migrate or index the items table: %s", e)
+
+    return conn
+
+@st.cache_resource(ttl=3600, show_spinner=False)
+def load_catalog():
+    """Load the whole items table once, indexed by category and item name (read-only, shared)"""
+    catalog = {"by_cat": {}, "by_name": {}}
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT category, item_name, hsn_code, rate_of_gst_pct FROM items ORDER BY category, item_name")
+    for category, item_name, hsn_code, rate_of_gst_pct in cursor.fetchall():
+        catalog["by_cat"].setdefault(category, []).append((item_name, hsn_code, rate_of_gst_pct))
+        catalog["by_name"].setdefault(item_name, (hsn_code, rate_of_gst_pct))
+    return catalog
+
+def get_catalog():
+    """Cached catalog, or an empty one on error (errors raise out of load_catalog so they are not cached)"""
+    try:
+        return load_catalog()
     except Exception as e:
         st.error(f"Database error: {e}")
-        return None, None
+        return {"by_cat": {}, "by_name": {}}
+
+_INVOICE_ITEM_ROW = itemgetter('item_name', 'hsn_code', 'quantity', 'unit_price',
+                               'amount', 'gst_rate', 'gst_amount')
+
+def persist_invoice(invoice):
+    """Persist an invoice and all its items in a single transaction"""
+    invoice_number = invoice['invoice_number']
+    seller = invoice['seller_info']
+    buyer = invoice['buyer_info']
+    totals = invoice['totals']
+    item_rows = [(invoice_number,) + _INVOICE_ITEM_ROW(item) for item in invoice['items']]
+    
+    # Writes go through a pooled connection borrowed by this thread alone: on the
+    # process-shared read connection, concurrent sessions' transactions would mix
+    get_db_connection()  # makes sure the draft tables exist
+    with get_conn() as conn, conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO invoices (
+                invoice_number, gstin_number, invoice_date,
+                seller_name, seller_address, seller_contact, seller_bank,
+                buyer_name, buyer_address, buyer_contact, buyer_gstin,
+                total_amount, total_gst, grand_total
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            invoice_number, invoice['gstin_number'], invoice['invoice_date'],
+            seller['name'], seller['address'], seller['contact'], seller['bank_account'],
+            buyer['name'], buyer['address'], buyer['contact'], buyer['gstin'],
+            totals['total_amount'], totals['total_gst'], totals['grand_total']
+        ))
+        # Re-saving a draft replaces its items rather than appending duplicates
+        conn.execute("DELETE FROM invoice_items WHERE invoice_number = ?", (invoice_number,))
+        conn.executemany("""
+            INSERT INTO invoice_items (
+                invoice_number, item_name, hsn_code, quantity, unit_price, amount, gst_rate, gst_amount
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, item_rows)
+
+EXTRACTION_CACHE_TTL = 7 * 24 * 60 * 60
+
+@st.cache_resource(show_spinner=False)
+def get_redis_client():
+    """Shared Redis client when REDIS_URL is set, so replicas share extraction results"""
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        return None
+    try:
+        import redis
+    except ImportError:
+        logging.getLogger(__name__).warning("REDIS_URL is set but the redis package is not installed")
+        return None
+    return redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+
+def get_cached_extraction(content_hash):
+    """Return previously extracted data for identical file content, if any"""
+    redis_client = get_redis_client()
+    if redis_client is not None:
+        try:
+            cached = redis_client.get(f"invoice:{content_hash}")
+            if cached is not None:
+                return json.loads(cached)
+        except Exception as e:
+            # Fall back to the local cache when Redis is unreachable
+            logging.getLogger(__name__).warning("Redis cache lookup failed: %s", e)
+    
+    try:
+        row = get_db_connection().execute(
+            "SELECT extracted_json FROM extraction_cache WHERE content_hash = ?", (content_hash,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        logging.getLogger(__name__).warning("Extraction cache lookup failed: %s", e)
+        return None
+    return json.loads(row[0]) if row else None
+
+def store_cached_extraction(content_hash, extracted_data):
+    """Remember extracted data so re-uploads skip OCR and the Gemini call"""
+    redis_client = get_redis_client()
+    if redis_client is not None:
+        try:
+            redis_client.setex(f"invoice:{content_hash}", EXTRACTION_CACHE_TTL, json.dumps(extracted_data))
+        except Exception as e:
+            logging.getLogger(__name__).warning("Redis cache store failed: %s", e)
+    
+    try:
+        # Pooled connection, not the shared read connection (see persist_invoice)
+        get_db_connection()  # makes sure extraction_cache exists
+        with get_conn() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (content_hash, extracted_json) VALUES (?, ?)",
+                (content_hash, json.dumps(extracted_data))
+            )
+    except sqlite3.Error as e:
+        logging.getLogger(__name__).warning("Extraction cache store failed: %s", e)
+
+def get_all_categories():
+    """Get all categories from the cached catalog"""
+    return list(get_catalog()["by_cat"])
+
+def get_items_by_category(category):
+    """Get items by category from the cached catalog"""
+    return get_catalog()["by_cat"].get(category, [])
+
+def get_item_details(item_name):
+    """Get HSN code and GST percentage for specific item"""
+    return get_catalog()["by_name"].get(item_name, (None, None))
 
 # ==================== UTILITY FUNCTIONS ====================
 def generate_invoice_number():
@@ -83,19 +205,56 @@ def generate_invoice_number():
     random_num = random.randint(1000, 9999)
     return f"{prefix}/{year}/{random_num}"
 
+_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_ALPHANUMERIC = _ALPHABET + '1234567890'
+
 def generate_gstin():
     """Generate random GSTIN number"""
-    state_code = str(random.randint(1, 37)).zfill(2)
-    pan = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=10))
-    entity_code = str(random.randint(1, 9))
-    check_digit = random.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890')
-    return f"{state_code}{pan}{entity_code}Z{check_digit}"
+    # A single 64-bit draw supplies every field via successive divmod
+    r = int.from_bytes(os.urandom(8), 'big')
+    r, state_index = divmod(r, 37)
+    pan_chars = []
+    for _ in range(10):
+        r, char_index = divmod(r, 26)
+        pan_chars.append(_ALPHABET[char_index])
+    r, entity_index = divmod(r, 9)
+    check_digit = _ALPHANUMERIC[r % 36]
+    return f"{state_index + 1:02d}{''.join(pan_chars)}{entity_index + 1}Z{check_digit}"
+
+def calculate_bill_totals(items):
+    """Calculate total amount and total GST for bill items"""
+    amounts = np.fromiter((item['amount'] for item in items), dtype=np.float64, count=len(items))
+    gst_amounts = np.fromiter((item['gst_amount'] for item in items), dtype=np.float64, count=len(items))
+    return float(amounts.sum()), float(gst_amounts.sum())
+
+INVOICE_FIELDS = ['file_name', 'invoice_no', 'gstin_no', 'seller_name', 'customer_name',
+                  'grand_total', 'total_gst', 'place', 'date', 'state']
+ITEM_FIELDS = ['item_name', 'category', 'hsn_code', 'quantity', 'unit_price', 'amount', 'gst_rate']
+
+@st.cache_data(show_spinner=False)
+def build_invoice_frames(invoices):
+    """Split invoices into an invoice-level DataFrame and an items DataFrame
+    
+    Items carry an ``invoice_index`` column pointing at their invoice row.
+    """
+    invoices_df = pd.DataFrame(list(invoices)).reindex(columns=INVOICE_FIELDS)
+    for column in ('grand_total', 'total_gst'):
+        invoices_df[column] = pd.to_numeric(invoices_df[column], errors='coerce').fillna(0)
+    
+    items_df = pd.DataFrame(
+        [dict(item, invoice_index=i)
+         for i, invoice in enumerate(invoices)
+         for item in invoice.get('items') or []]
+    ).reindex(columns=['invoice_index'] + ITEM_FIELDS)
+    
+    return invoices_df, items_df
 
 def calculate_summary_statistics(invoices):
     """Calculate summary statistics for invoices"""
-    total_invoices = len(invoices)
-    total_grand_total = sum(invoice.get('grand_total', 0) for invoice in invoices)
-    total_gst_amount = sum(invoice.get('total_gst', 0) for invoice in invoices)
+    invoices_df, _ = build_invoice_frames(invoices)
+    total_invoices = len(invoices_df)
+    total_grand_total = float(invoices_df['grand_total'].sum())
+    total_gst_amount = float(invoices_df['total_gst'].sum())
     total_taxable_amount = total_grand_total - total_gst_amount
     
     return {
@@ -120,10 +279,15 @@ def table_view_page():
     
     st.success(f"✅ Found {len(extracted_invoices)} extracted invoice(s)")
     
+    _, items_df = build_invoice_frames(extracted_invoices)
+    items_by_invoice = dict(tuple(items_df.groupby('invoice_index')))
+    
     # Display each invoice in an expandable section
     for i, invoice in enumerate(extracted_invoices):
-        with st.expander(f"📄 {invoice.get('file_name', f'Invoice {i+1}')}", expanded=True):
-            display_single_invoice_data(invoice, i+1)
+        with st.expander(f"📄 {invoice.get('file_name', f'Invoice {i+1}')}", expanded=(i == 0)):
+            # Only the first invoice is rendered up front; others on demand
+            if st.toggle("Show details", value=(i == 0), key=f"open_inv_{i}"):
+                display_single_invoice_data(invoice, i+1, items_by_invoice.get(i))
     
     # Download options
     st.markdown("---")
@@ -133,8 +297,7 @@ def table_view_page():
     
     with col1:
         # JSON Download - Enhanced with items and summary
-        enhanced_json_data = prepare_enhanced_json_data(extracted_invoices)
-        json_data = json.dumps(enhanced_json_data, indent=2)
+        json_data = build_enhanced_json(extracted_invoices)
         st.download_button(
             label="📄 Download JSON (Full Data)",
             data=json_data,
@@ -145,12 +308,11 @@ def table_view_page():
     
     with col2:
         # CSV Download - Enhanced format with items and summary
-        csv_data = prepare_enhanced_csv_data(extracted_invoices)
-        csv_file = csv_data.to_csv(index=False)
+        csv_data = build_enhanced_csv(extracted_invoices)
         
         st.download_button(
             label="📊 Download CSV (Full Data)",
-            data=csv_file,
+            data=csv_data,
             file_name="all_extracted_invoices_with_items.csv",
             mime="text/csv",
             use_container_width=True
@@ -161,7 +323,7 @@ def table_view_page():
     st.subheader("📈 Summary Statistics")
     display_summary_statistics(extracted_invoices)
 
-def display_single_invoice_data(invoice, invoice_number):
+def display_single_invoice_data(invoice, invoice_number, items_df=None):
     """Display data for a single invoice in an organized format with items table"""
     
     # Create columns for better layout
@@ -169,33 +331,27 @@ def display_single_invoice_data(invoice, invoice_number):
     
     with col1:
         st.subheader("🧔 Seller Information")
-        seller_info_html = f"""
-        <div style='background-color: #f8f9fa; padding: 15px; border-radius: 10px; border-left: 4px solid #28a745;'>
-            <p><strong>Seller Name:</strong> {invoice.get('seller_name', 'N/A')}</p>
-            <p><strong>GSTIN:</strong> {invoice.get('gstin_no', 'N/A')}</p>
-            <p><strong>Place:</strong> {invoice.get('place', 'N/A')}</p>
-            <p><strong>State:</strong> {invoice.get('state', 'N/A')}</p>
-        </div>
-        """
-        st.markdown(seller_info_html, unsafe_allow_html=True)
+        display_info_table({
+            'Seller Name': invoice.get('seller_name', 'N/A'),
+            'GSTIN': invoice.get('gstin_no', 'N/A'),
+            'Place': invoice.get('place', 'N/A'),
+            'State': invoice.get('state', 'N/A')
+        })
     
     with col2:
         st.subheader("👤 Customer Information")
-        customer_info_html = f"""
-        <div style='background-color: #f8f9fa; padding: 15px; border-radius: 10px; border-left: 4px solid #007bff;'>
-            <p><strong>Customer Name:</strong> {invoice.get('customer_name', 'N/A')}</p>
-            <p><strong>Invoice Date:</strong> {invoice.get('date', 'N/A')}</p>
-            <p><strong>Invoice No:</strong> {invoice.get('invoice_no', 'N/A')}</p>
-        </div>
-        """
-        st.markdown(customer_info_html, unsafe_allow_html=True)
+        display_info_table({
+            'Customer Name': invoice.get('customer_name', 'N/A'),
+            'Invoice Date': invoice.get('date', 'N/A'),
+            'Invoice No': invoice.get('invoice_no', 'N/A')
+        })
     
     # Items Table Section
     st.markdown("---")
     st.subheader("📦 Invoice Items")
     
-    if 'items' in invoice and invoice['items']:
-        display_items_table(invoice['items'])
+    if items_df is not None and not items_df.empty:
+        display_items_table(items_df, key=f"all_items_{invoice_number}")
     else:
         st.info("No detailed item information available for this invoice.")
     
@@ -203,24 +359,27 @@ def display_single_invoice_data(invoice, invoice_number):
     st.markdown("---")
     st.subheader("💰 Financial Summary")
     
+    grand_total = invoice.get('grand_total', 0)
+    total_gst = invoice.get('total_gst', 0)
+    taxable_amount = grand_total - total_gst
+    
     col1, col2, col3 = st.columns(3)
     
     with col1:
         st.metric(
             "Grand Total", 
-            f"₹{invoice.get('grand_total', 0):,.2f}",
+            f"₹{grand_total:,.2f}",
             help="Total amount including all taxes"
         )
     
     with col2:
         st.metric(
             "Total GST", 
-            f"₹{invoice.get('total_gst', 0):,.2f}",
+            f"₹{total_gst:,.2f}",
             help="Total GST amount calculated"
         )
     
     with col3:
-        taxable_amount = invoice.get('grand_total', 0) - invoice.get('total_gst', 0)
         st.metric(
             "Taxable Amount", 
             f"₹{taxable_amount:,.2f}",
@@ -230,35 +389,49 @@ def display_single_invoice_data(invoice, invoice_number):
     # File Information
     st.markdown("---")
     st.subheader("📁 File Information")
-    file_info_html = f"""
-    <div style='background-color: #e9ecef; padding: 10px; border-radius: 5px;'>
-        <p><strong>File Name:</strong> {invoice.get('file_name', 'N/A')}</p>
-        <p><strong>Extraction Status:</strong> ✅ Verified</p>
-    </div>
-    """
-    st.markdown(file_info_html, unsafe_allow_html=True)
+    display_info_table({
+        'File Name': invoice.get('file_name', 'N/A'),
+        'Extraction Status': '✅ Verified'
+    })
 
-def display_items_table(items):
-    """Display items in a formatted table"""
-    if not items:
+def display_info_table(fields):
+    """Display label/value pairs as a native two-column table"""
+    df = pd.DataFrame(
+        [(label, str(value)) for label, value in fields.items()],
+        columns=['Field', 'Value']
+    ).set_index('Field')
+    st.table(df)
+
+ITEMS_PREVIEW_ROWS = 20
+
+ITEM_DISPLAY_COLUMNS = {
+    'item_name': 'Item Name',
+    'hsn_code': 'HSN Code',
+    'quantity': 'Quantity',
+    'unit_price': 'Unit Price',
+    'amount': 'Amount',
+    'gst_rate': 'GST Rate'
+}
+ITEM_PRICE_FORMAT = {'Unit Price': '₹{:.2f}', 'Amount': '₹{:.2f}'}
+
+def display_items_table(items_df, key):
+    """Display items DataFrame in a formatted table"""
+    if items_df.empty:
         st.info("No items data available")
         return
     
-    # Prepare display data
-    display_data = []
-    for i, item in enumerate(items):
-        display_data.append({
-            'Sr No': i + 1,
-            'Item Name': item.get('item_name', 'N/A'),
-            'HSN Code': item.get('hsn_code', 'N/A'),
-            'Quantity': item.get('quantity', 'N/A'),
-            'Unit Price': f"₹{item.get('unit_price', 0):.2f}",
-            'Amount': f"₹{item.get('amount', 0):.2f}",
-            'GST Rate': item.get('gst_rate', 'N/A')
-        })
+    # Large invoices show the first rows unless the user asks for all
+    shown_items = items_df
+    if len(items_df) > ITEMS_PREVIEW_ROWS and not st.toggle(f"Show all {len(items_df)} items", key=key):
+        shown_items = items_df.head(ITEMS_PREVIEW_ROWS)
     
-    df = pd.DataFrame(display_data)
-    st.dataframe(df, use_container_width=True)
+    # Prepare display data; currency formatting is applied by the Styler
+    df = shown_items[list(ITEM_DISPLAY_COLUMNS)].reset_index(drop=True)
+    for column in ('unit_price', 'amount'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0)
+    df = df.fillna('N/A').rename(columns=ITEM_DISPLAY_COLUMNS)
+    df.insert(0, 'Sr No', range(1, len(df) + 1))
+    st.dataframe(df.style.format(ITEM_PRICE_FORMAT), use_container_width=True)
     
     # Show items summary
     # (Items summary metrics removed as per requirements)
@@ -285,6 +458,8 @@ def prepare_enhanced_json_data(invoices):
     }
     
     for invoice in invoices:
+        grand_total = invoice.get('grand_total', 0)
+        total_gst = invoice.get('total_gst', 0)
         invoice_data = {
             'file_name': invoice.get('file_name', ''),
             'invoice_number': invoice.get('invoice_no', ''),
@@ -299,9 +474,9 @@ def prepare_enhanced_json_data(invoices):
                 'name': invoice.get('customer_name', ''),
             },
             'financial_summary': {
-                'grand_total': invoice.get('grand_total', 0),
-                'total_gst': invoice.get('total_gst', 0),
-                'taxable_amount': invoice.get('grand_total', 0) - invoice.get('total_gst', 0)
+                'grand_total': grand_total,
+                'total_gst': total_gst,
+                'taxable_amount': grand_total - total_gst
             },
             'items': invoice.get('items', [])
         }
@@ -309,94 +484,78 @@ def prepare_enhanced_json_data(invoices):
     
     return enhanced_data
 
+ENHANCED_CSV_COLUMNS = [
+    'File Name', 'Invoice Number', 'Invoice Date', 'Seller Name', 'Seller GSTIN',
+    'Seller Place', 'Seller State', 'Customer Name', 'Item Name', 'Item Category',
+    'HSN Code', 'Quantity', 'Unit Price', 'Item Amount', 'GST Rate',
+    'Grand Total', 'Total GST', 'Taxable Amount'
+]
+
 def prepare_enhanced_csv_data(invoices):
-    """Prepare enhanced CSV data with all invoice and item information including summary"""
-    csv_rows = []
+    """Prepare enhanced CSV text with all invoice and item information including summary"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(ENHANCED_CSV_COLUMNS)
     
     for invoice in invoices:
-        # Add main invoice row
+        # Invoice-level columns are shared by every item row
+        invoice_info = (
+            invoice.get('file_name', ''),
+            invoice.get('invoice_no', ''),
+            invoice.get('date', ''),
+            invoice.get('seller_name', ''),
+            invoice.get('gstin_no', ''),
+            invoice.get('place', ''),
+            invoice.get('state', ''),
+            invoice.get('customer_name', '')
+        )
+        grand_total = invoice.get('grand_total', 0)
+        total_gst = invoice.get('total_gst', 0)
+        totals = (grand_total, total_gst, grand_total - total_gst)
+        
         if 'items' in invoice and invoice['items']:
             for item in invoice['items']:
-                csv_rows.append({
-                    'File Name': invoice.get('file_name', ''),
-                    'Invoice Number': invoice.get('invoice_no', ''),
-                    'Invoice Date': invoice.get('date', ''),
-                    'Seller Name': invoice.get('seller_name', ''),
-                    'Seller GSTIN': invoice.get('gstin_no', ''),
-                    'Seller Place': invoice.get('place', ''),
-                    'Seller State': invoice.get('state', ''),
-                    'Customer Name': invoice.get('customer_name', ''),
-                    'Item Name': item.get('item_name', ''),
-                    'Item Category': item.get('category', ''),
-                    'HSN Code': item.get('hsn_code', ''),
-                    'Quantity': item.get('quantity', ''),
-                    'Unit Price': item.get('unit_price', ''),
-                    'Item Amount': item.get('amount', ''),
-                    'GST Rate': item.get('gst_rate', ''),
-                    'Grand Total': invoice.get('grand_total', 0),
-                    'Total GST': invoice.get('total_gst', 0),
-                    'Taxable Amount': invoice.get('grand_total', 0) - invoice.get('total_gst', 0)
-                })
+                writer.writerow(invoice_info + (
+                    item.get('item_name', ''),
+                    item.get('category', ''),
+                    item.get('hsn_code', ''),
+                    item.get('quantity', ''),
+                    item.get('unit_price', ''),
+                    item.get('amount', ''),
+                    item.get('gst_rate', '')
+                ) + totals)
         else:
             # If no items data, add a single row for the invoice
-            csv_rows.append({
-                'File Name': invoice.get('file_name', ''),
-                'Invoice Number': invoice.get('invoice_no', ''),
-                'Invoice Date': invoice.get('date', ''),
-                'Seller Name': invoice.get('seller_name', ''),
-                'Seller GSTIN': invoice.get('gstin_no', ''),
-                'Seller Place': invoice.get('place', ''),
-                'Seller State': invoice.get('state', ''),
-                'Customer Name': invoice.get('customer_name', ''),
-                'Item Name': 'N/A',
-                'Item Category': 'N/A',
-                'HSN Code': 'N/A',
-                'Quantity': 'N/A',
-                'Unit Price': 'N/A',
-                'Item Amount': 'N/A',
-                'GST Rate': 'N/A',
-                'Grand Total': invoice.get('grand_total', 0),
-                'Total GST': invoice.get('total_gst', 0),
-                'Taxable Amount': invoice.get('grand_total', 0) - invoice.get('total_gst', 0)
-            })
-    
-    # Create DataFrame
-    df = pd.DataFrame(csv_rows)
+            writer.writerow(invoice_info + ('N/A',) * 7 + totals)
     
     # Add summary statistics as additional rows
     stats = calculate_summary_statistics(invoices)
     
-    # Create summary rows
-    summary_rows = [
-       {'File Name': 'SUMMARY STATISTICS', 'Invoice Number': '', 'Invoice Date': '', 'Seller Name': '', 
-        'Seller GSTIN': '', 'Seller Place': '', 'Seller State': '', 'Customer Name': '', 
-        'Item Name': '', 'Item Category': '', 'HSN Code': '', 'Quantity': '', 'Unit Price': '', 
-        'Item Amount': '', 'GST Rate': '', 'Grand Total': '', 'Total GST': '', 
-        'Taxable Amount': ''},
-       {'File Name': f'Total Invoices: {stats["total_invoices"]}', 'Invoice Number': '', 'Invoice Date': '', 
-        'Seller Name': '', 'Seller GSTIN': '', 'Seller Place': '', 'Seller State': '', 'Customer Name': '', 
-        'Item Name': '', 'Item Category': '', 'HSN Code': '', 'Quantity': '', 'Unit Price': '', 
-        'Item Amount': '', 'GST Rate': '', 'Grand Total': '', 'Total GST': '', 
-        'Taxable Amount': ''},
-       {'File Name': f'Total Grand Total: {stats["total_grand_total"]:,.2f}', 'Invoice Number': '', 
-        'Invoice Date': '', 'Seller Name': '', 'Seller GSTIN': '', 'Seller Place': '', 'Seller State': '', 
-        'Customer Name': '', 'Item Name': '', 'Item Category': '', 'HSN Code': '', 'Quantity': '', 
-        'Unit Price': '', 'Item Amount': '', 'GST Rate': '', 'Grand Total': '', 'Total GST': '', 'Taxable Amount': ''},
-       {'File Name': f'Total GST Amount: {stats["total_gst_amount"]:,.2f}', 'Invoice Number': '', 
-        'Invoice Date': '', 'Seller Name': '', 'Seller GSTIN': '', 'Seller Place': '', 'Seller State': '', 
-        'Customer Name': '', 'Item Name': '', 'Item Category': '', 'HSN Code': '', 'Quantity': '', 
-        'Unit Price': '', 'Item Amount': '', 'GST Rate': '', 'Grand Total': '', 'Total GST': '', 'Taxable Amount': ''},
-       {'File Name': f'Total Taxable Amount: {stats["total_taxable_amount"]:,.2f}', 'Invoice Number': '', 
-        'Invoice Date': '', 'Seller Name': '', 'Seller GSTIN': '', 'Seller Place': '', 'Seller State': '', 
-        'Customer Name': '', 'Item Name': '', 'Item Category': '', 'HSN Code': '', 'Quantity': '', 
-        'Unit Price': '', 'Item Amount': '', 'GST Rate': '', 'Grand Total': '', 'Total GST': '', 'Taxable Amount': ''}
+    summary_labels = [
+        'SUMMARY STATISTICS',
+        f'Total Invoices: {stats["total_invoices"]}',
+        f'Total Grand Total: {stats["total_grand_total"]:,.2f}',
+        f'Total GST Amount: {stats["total_gst_amount"]:,.2f}',
+        f'Total Taxable Amount: {stats["total_taxable_amount"]:,.2f}'
     ]
+    padding = ('',) * (len(ENHANCED_CSV_COLUMNS) - 1)
+    writer.writerows((label,) + padding for label in summary_labels)
     
-    # Convert summary rows to DataFrame and concatenate
-    summary_df = pd.DataFrame(summary_rows)
-    final_df = pd.concat([df, summary_df], ignore_index=True)
-    
-    return final_df
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def build_enhanced_json(invoices):
+    """Serialize enhanced JSON download (cached on invoice list contents)"""
+    enhanced_json_data = prepare_enhanced_json_data(invoices)
+    if orjson is not None:
+        return orjson.dumps(enhanced_json_data, option=orjson.OPT_INDENT_2)
+    # Same shape as orjson OPT_INDENT_2: two-space indent, raw UTF-8 text
+    return json.dumps(enhanced_json_data, indent=2, ensure_ascii=False)
+
+@st.cache_data(show_spinner=False)
+def build_enhanced_csv(invoices):
+    """Serialize enhanced CSV download (cached on invoice list contents)"""
+    return prepare_enhanced_csv_data(invoices)
 
 # ==================== BILL GENERATION PAGE ====================
 def bill_generation_page():
@@ -455,10 +614,11 @@ def bill_generation_page():
     # Item Addition Section
     st.subheader("📦 Add Items to Invoice")
     
+    categories = get_all_categories()
+    
     col1, col2, col3, col4, col5 = st.columns([2, 2, 1, 1, 1])
     
     with col1:
-        categories = get_all_categories()
         selected_category = st.selectbox("Category", [""] + categories, key="category_select")
     
     with col2:
@@ -479,12 +639,11 @@ def bill_generation_page():
         if st.button("➕ Add Item", use_container_width=True):
             if selected_item and quantity > 0 and unit_price > 0:
                 # Get HSN code and GST rate from database
-                hsn_code, gst_rate = get_item_details(selected_item)
+                hsn_code, gst_percentage = get_item_details(selected_item)
                 
-                if hsn_code and gst_rate:
+                if hsn_code and gst_percentage is not None:
                     amount = quantity * unit_price
-                    # Extract GST percentage from string (e.g., "5%" -> 5.0)
-                    gst_percentage = float(gst_rate.strip('%'))
+                    gst_rate = f"{gst_percentage:g}%"
                     gst_amount = (amount * gst_percentage) / 100
                     
                     item_data = {
@@ -512,24 +671,13 @@ def bill_generation_page():
         st.subheader("📊 Current Invoice Items")
         
         # Prepare display data
-        display_data = []
-        for i, item in enumerate(st.session_state.bill_items):
-            display_data.append({
-                'Sr No': i + 1,
-                'Item Name': item['item_name'],
-                'HSN Code': item['hsn_code'],
-                'Quantity': item['quantity'],
-                'Unit Price': f"₹{item['unit_price']:.2f}",
-                'Amount': f"₹{item['amount']:.2f}",
-                'GST Rate': item['gst_rate']
-            })
-        
-        df = pd.DataFrame(display_data)
-        st.dataframe(df, use_container_width=True)
+        df = pd.DataFrame(st.session_state.bill_items, columns=list(ITEM_DISPLAY_COLUMNS))
+        df = df.rename(columns=ITEM_DISPLAY_COLUMNS)
+        df.insert(0, 'Sr No', range(1, len(df) + 1))
+        st.dataframe(df.style.format(ITEM_PRICE_FORMAT), use_container_width=True)
         
         # Calculate totals
-        total_amount = sum(item['amount'] for item in st.session_state.bill_items)
-        total_gst = sum(item['gst_amount'] for item in st.session_state.bill_items)
+        total_amount, total_gst = calculate_bill_totals(st.session_state.bill_items)
         grand_total = total_amount + total_gst
         
         # Display totals
@@ -557,7 +705,7 @@ def bill_generation_page():
         with col3:
             if st.button("📄 Generate PDF Invoice", use_container_width=True, type="primary"):
                 if seller_name and seller_address and buyer_name and buyer_address:
-                    pdf_buffer = generate_pdf_invoice(
+                    pdf_bytes = generate_pdf_invoice(
                         seller_name, seller_address, seller_contact, seller_bank,
                         buyer_name, buyer_address, buyer_contact, buyer_gstin,
                         invoice_date, total_amount, total_gst, grand_total
@@ -566,7 +714,7 @@ def bill_generation_page():
                     # Download button for PDF
                     st.download_button(
                         label="📥 Download PDF Invoice",
-                        data=pdf_buffer.getvalue(),
+                        data=pdf_bytes,
                         file_name=f"Invoice_{st.session_state.invoice_number.replace('/', '_')}.pdf",
                         mime="application/pdf",
                         use_container_width=True
@@ -577,7 +725,7 @@ def bill_generation_page():
 def save_invoice_draft(seller_name, seller_address, seller_contact, seller_bank,
                       buyer_name, buyer_address, buyer_contact, buyer_gstin,
                       invoice_date, total_amount, total_gst, grand_total):
-    """Save invoice draft to session state"""
+    """Save invoice draft to session state and the database"""
     invoice_data = {
         'invoice_number': st.session_state.invoice_number,
         'gstin_number': st.session_state.gstin_number,
@@ -603,43 +751,135 @@ def save_invoice_draft(seller_name, seller_address, seller_contact, seller_bank,
     }
     
     st.session_state.invoice_draft = invoice_data
+    
+    try:
+        persist_invoice(invoice_data)
+    except sqlite3.Error as e:
+        st.warning(f"Draft kept in this session only; database save failed: {e}")
+        return
+    
     st.success("✅ Invoice draft saved successfully!")
 
+@st.cache_resource
+def get_pdf_styles():
+    """Build reusable ReportLab styles for PDF invoices (once per process)"""
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+    from reportlab.lib import colors
+    
+    sample_styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=sample_styles['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor('#2E86AB'),
+        spaceAfter=30,
+        alignment=1  # Center aligned
+    )
+
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=sample_styles['Normal'],
+        fontSize=8,
+        textColor=colors.grey,
+        alignment=1
+    )
+
+    header_table_style = TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
+        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F8F9FA')),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('PADDING', (0, 0), (-1, -1), 6),
+    ])
+
+    parties_table_style = TableStyle([
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
+        ('FONT', (0, 1), (-1, 1), 'Helvetica', 9),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('PADDING', (0, 0), (-1, -1), 8),
+    ])
+
+    items_table_style = TableStyle([
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
+        ('FONT', (0, 1), (-1, -1), 'Helvetica', 7),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('PADDING', (0, 0), (-1, -1), 4),
+        ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
+    ])
+
+    totals_table_style = TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica-Bold', 10),
+        ('BACKGROUND', (-1, -1), (-1, -1), colors.HexColor('#FF6B6B')),
+        ('TEXTCOLOR', (-1, -1), (-1, -1), colors.whitesmoke),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('PADDING', (0, 0), (-1, -1), 8),
+        ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
+    ])
+    
+    return {
+        'title': title_style,
+        'footer': footer_style,
+        'header_table': header_table_style,
+        'parties_table': parties_table_style,
+        'items_table': items_table_style,
+        'totals_table': totals_table_style
+    }
+
 def generate_pdf_invoice(seller_name, seller_address, seller_contact, seller_bank,
                         buyer_name, buyer_address, buyer_contact, buyer_gstin,
                         invoice_date, total_amount, total_gst, grand_total):
-    """Generate PDF invoice using ReportLab"""
+    """Generate PDF invoice bytes, reusing the cached render for identical invoices"""
+    items = tuple(
+        (item['item_name'], item['hsn_code'], item['quantity'],
+         item['unit_price'], item['amount'], item['gst_rate'])
+        for item in st.session_state.bill_items
+    )
+    invoice_key = (
+        st.session_state.invoice_number,
+        st.session_state.gstin_number,
+        invoice_date,
+        (seller_name, seller_address, seller_contact, seller_bank),
+        (buyer_name, buyer_address, buyer_contact, buyer_gstin),
+        items,
+        (total_amount, total_gst, grand_total)
+    )
+    return build_pdf_bytes(invoice_key)
+
+@st.cache_data(show_spinner=False)
+def build_pdf_bytes(invoice_key):
+    """Build PDF invoice using ReportLab"""
+    (invoice_number, gstin_number, invoice_date, seller, buyer, items, totals) = invoice_key
+    seller_name, seller_address, seller_contact, seller_bank = seller
+    buyer_name, buyer_address, buyer_contact, buyer_gstin = buyer
+    total_amount, total_gst, grand_total = totals
+    
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+    
+    styles = get_pdf_styles()
+    
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=50, bottomMargin=50)
     
-    styles = getSampleStyleSheet()
     story = []
     
     # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#2E86AB'),
-        spaceAfter=30,
-        alignment=1  # Center aligned
-    )
-    title = Paragraph("TAX INVOICE", title_style)
+    title = Paragraph("TAX INVOICE", styles['title'])
     story.append(title)
     
     # Invoice header table
     header_data = [
-        ['Invoice Number:', st.session_state.invoice_number, 'Invoice Date:', invoice_date.strftime("%d-%m-%Y")],
-        ['GSTIN:', st.session_state.gstin_number, 'Reverse Charge:', 'No']
+        ['Invoice Number:', invoice_number, 'Invoice Date:', invoice_date.strftime("%d-%m-%Y")],
+        ['GSTIN:', gstin_number, 'Reverse Charge:', 'No']
     ]
     
     header_table = Table(header_data, colWidths=[100, 150, 100, 150])
-    header_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F8F9FA')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('PADDING', (0, 0), (-1, -1), 6),
-    ]))
+    header_table.setStyle(styles['header_table'])
     story.append(header_table)
     story.append(Spacer(1, 20))
     
@@ -651,14 +891,7 @@ def generate_pdf_invoice(seller_name, seller_address, seller_contact, seller_ban
     ]
     
     parties_table = Table(parties_data, colWidths=[250, 250])
-    parties_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
-        ('FONT', (0, 1), (-1, 1), 'Helvetica', 9),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('PADDING', (0, 0), (-1, -1), 8),
-    ]))
+    parties_table.setStyle(styles['parties_table'])
     story.append(parties_table)
     story.append(Spacer(1, 20))
     
@@ -666,27 +899,19 @@ def generate_pdf_invoice(seller_name, seller_address, seller_contact, seller_ban
     items_header = ['Sr No', 'Item Description', 'HSN Code', 'Quantity', 'Unit Price', 'Amount', 'GST Rate']
     items_data = [items_header]
     
-    for i, item in enumerate(st.session_state.bill_items):
+    for i, (item_name, hsn_code, quantity, unit_price, amount, gst_rate) in enumerate(items):
         items_data.append([
             str(i + 1),
-            f"{item['item_name']}",
-            item['hsn_code'],
-            str(item['quantity']),
-            f"₹{item['unit_price']:.2f}",
-            f"₹{item['amount']:.2f}",
-            item['gst_rate']
+            f"{item_name}",
+            hsn_code,
+            str(quantity),
+            f"₹{unit_price:.2f}",
+            f"₹{amount:.2f}",
+            gst_rate
         ])
     
     items_table = Table(items_data, colWidths=[30, 160, 60, 40, 60, 60, 60])
-    items_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
-        ('FONT', (0, 1), (-1, -1), 'Helvetica', 7),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('PADDING', (0, 0), (-1, -1), 4),
-        ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
-    ]))
+    items_table.setStyle(styles['items_table'])
     story.append(items_table)
     story.append(Spacer(1, 20))
     
@@ -698,33 +923,25 @@ def generate_pdf_invoice(seller_name, seller_address, seller_contact, seller_ban
     ]
     
     totals_table = Table(totals_data, colWidths=[100, 100])
-    totals_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica-Bold', 10),
-        ('BACKGROUND', (-1, -1), (-1, -1), colors.HexColor('#FF6B6B')),
-        ('TEXTCOLOR', (-1, -1), (-1, -1), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('PADDING', (0, 0), (-1, -1), 8),
-        ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
-    ]))
+    totals_table.setStyle(styles['totals_table'])
     story.append(totals_table)
     
     # Footer
     story.append(Spacer(1, 30))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=1
-    )
-    footer = Paragraph("This is a computer-generated invoice. No signature required.", footer_style)
+    footer = Paragraph("This is a computer-generated invoice. No signature required.", styles['footer'])
     story.append(footer)
     
     doc.build(story)
-    buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
 
 # ==================== MULTI-FILE TAX INVOICE EXTRACTION MODULE ====================
+EXTRACTION_WORKERS = min(8, os.cpu_count() or 4)
+EXTRACTION_BATCH_SIZE = 10
+
+# Files are OCR'd in parallel by the extraction pool, so keep each Tesseract
+# subprocess single-threaded instead of oversubscribing the CPU with OpenMP
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 def multi_invoice_extraction_page():
     st.header("🧾 Multi-Invoice Data Extraction")
     st.markdown("Upload multiple tax invoices (PDF/Image) and extract structured data in batch")
@@ -772,30 +989,120 @@ def multi_invoice_extraction_page():
             st.session_state.show_final_table = False
             st.session_state.all_extracted_data = []
             
-            with st.spinner(f"🤖 AI is analyzing {len(uploaded_invoices)} invoice(s)..."):
+            with st.status(f"🤖 AI is analyzing {len(uploaded_invoices)} invoice(s)...", expanded=False) as status:
                 progress_bar = st.progress(0)
                 status_text = st.empty()
+                total_files = len(uploaded_invoices)
+                results = [None] * total_files
+                has_messages = False
                 
-                for i, uploaded_file in enumerate(uploaded_invoices):
-                    status_text.text(f"Processing {i+1}/{len(uploaded_invoices)}: {uploaded_file.name}")
-                    
-                    # Extract data from each file
-                    extracted_data = extract_invoice_data(uploaded_file)
+                # Redraw progress about 20 times per run rather than on every file
+                progress_step = max(1, total_files / 20)
+                reported = 0
+                
+                # Identical file content reuses the stored extraction, and duplicate
+                # uploads in this batch are only extracted once
+                content_hashes = [hash_upload(f) for f in uploaded_invoices]
+                first_index = {}
+                pending = []
+                for i, content_hash in enumerate(content_hashes):
+                    if content_hash in first_index:
+                        continue
+                    first_index[content_hash] = i
+                    results[i] = get_cached_extraction(content_hash)
+                    if results[i] is None:
+                        pending.append(i)
+                # Each pending file counts half for reading text and half for AI extraction
+                done = total_files - len(pending)
+                progress_bar.progress(done / total_files)
+                
+                # OCR and Gemini calls are I/O bound, so overlap them across files
+                with ThreadPoolExecutor(max_workers=max(1, min(EXTRACTION_WORKERS, len(pending)))) as executor:
+                    texts = {}
+                    futures = {
+                        executor.submit(extract_invoice_text, uploaded_invoices[i]): i
+                        for i in pending
+                    }
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        invoice_text, messages = future.result()
+                        if invoice_text:
+                            texts[i] = invoice_text
+                        done += 0.5 if invoice_text else 1
+                        
+                        # Streamlit calls must happen on the script thread
+                        for level, message in messages:
+                            getattr(st, level)(message)
+                            has_messages = True
+                        
+                        # Update progress
+                        if done - reported >= progress_step:
+                            reported = done
+                            status_text.text(f"Read text from {uploaded_invoices[i].name}")
+                            progress_bar.progress(done / total_files)
                     
+                    # One Gemini request per batch of invoices instead of one per file
+                    text_indices = sorted(texts)
+                    batches = [text_indices[start:start + EXTRACTION_BATCH_SIZE]
+                               for start in range(0, len(text_indices), EXTRACTION_BATCH_SIZE)]
+                    futures = {
+                        executor.submit(extract_invoices_batch, [texts[i] for i in batch]): batch
+                        for batch in batches
+                    }
+                    for future in as_completed(futures):
+                        batch = futures[future]
+                        batch_results, messages = future.result()
+                        for level, message in messages:
+                            getattr(st, level)(message)
+                            has_messages = True
+                        
+                        for i, extracted_data in zip(batch, batch_results):
+                            done += 0.5
+                            file_name = uploaded_invoices[i].name
+                            if not extracted_data:
+                                st.error(f"Failed to parse AI response as JSON for {file_name}")
+                                has_messages = True
+                                continue
+                            try:
+                                extracted_data = finalize_extracted_data(extracted_data, texts[i], file_name)
+                            except Exception as e:
+                                # One malformed reply fails its own file, not the whole upload
+                                st.error(f"Error processing {file_name}: {str(e)}")
+                                has_messages = True
+                                continue
+                            results[i] = extracted_data
+                            store_cached_extraction(content_hashes[i], extracted_data)
+                        
+                        # Update progress
+                        if done - reported >= progress_step:
+                            reported = done
+                            status_text.text(f"Processed {int(done)}/{total_files} invoice(s)")
+                            progress_bar.progress(done / total_files)
+                
+                # Duplicate uploads get their own copy of the first upload's data
+                for i, content_hash in enumerate(content_hashes):
+                    source = first_index[content_hash]
+                    if source != i and results[source]:
+                        results[i] = copy.deepcopy(results[source])
+                
+                # Keep results in upload order
+                for uploaded_file, extracted_data in zip(uploaded_invoices, results):
                     if extracted_data:
                         # Add filename to extracted data
                         extracted_data["file_name"] = uploaded_file.name
                         st.session_state.all_extracted_data.append(extracted_data)
-                    
-                    # Update progress
-                    progress_bar.progress((i + 1) / len(uploaded_invoices))
                 
+                progress_bar.progress(1.0)
                 status_text.text("✅ Extraction completed!")
                 st.session_state.extraction_complete = True
                 
                 if not st.session_state.all_extracted_data:
                     st.error("Failed to extract data from any invoices")
+                    status.update(label="Extraction failed", state="error", expanded=True)
                     return
+                
+                # Keep the panel open when there are warnings or errors to read
+                status.update(label="✅ Extraction completed!", state="complete", expanded=has_messages)
             
             # If manual mode is enabled, show verification interface
             if manual_mode and st.session_state.all_extracted_data:
@@ -947,6 +1254,19 @@ def show_manual_verification_interface():
                 st.session_state.verified_invoices.pop()
             st.rerun()
 
+PREVIEW_MAX_SIZE = (1200, 1600)
+
+@st.cache_data(show_spinner=False)
+def build_preview_thumbnail(file_content):
+    """Downscale an uploaded image to a JPEG preview (cached on file contents)"""
+    from PIL import Image
+    with Image.open(io.BytesIO(file_content)) as img:
+        img = img.convert('RGB')
+        img.thumbnail(PREVIEW_MAX_SIZE)
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
 def show_file_preview(filename):
     """Show preview of the uploaded file"""
     if filename in st.session_state.uploaded_invoices_dict:
@@ -965,36 +1285,58 @@ def show_file_preview(filename):
         else:
             # For images, display the image
             try:
-                image = Image.open(preview_file)
-                st.image(image, caption=f"Preview: {filename}", use_container_width=True)
+                st.image(build_preview_thumbnail(preview_file.getvalue()), caption=f"Preview: {filename}", use_container_width=True)
             except Exception as e:
                 st.error(f"Could not display image: {e}")
 
+VERIFIED_DISPLAY_COLUMNS = {
+    "file_name": "File Name",
+    "invoice_no": "Invoice No",
+    "gstin_no": "GSTIN No",
+    "seller_name": "Seller Name",
+    "customer_name": "Customer Name",
+    "grand_total": "Grand Total",
+    "total_gst": "Total GST",
+    "place": "Place",
+    "date": "Date",
+    "state": "State",
+}
+
+@st.cache_data(show_spinner=False)
+def build_verified_display_df(verified_invoices):
+    """Build the verified-invoices display table with column-wise pandas operations"""
+    df = pd.DataFrame.from_records(verified_invoices).reindex(columns=[*VERIFIED_DISPLAY_COLUMNS, "items"])
+    
+    display_df = df[list(VERIFIED_DISPLAY_COLUMNS)].astype(object).fillna("N/A")
+    for column in ("grand_total", "total_gst"):
+        amounts = pd.to_numeric(df[column], errors="coerce")
+        display_df[column] = amounts.map("₹{:.2f}".format).where(amounts.fillna(0) != 0, "N/A")
+    display_df["Items Count"] = df["items"].astype(object).str.len().fillna(0).astype(int)
+    
+    return display_df.rename(columns=VERIFIED_DISPLAY_COLUMNS)
+
+@st.cache_data(show_spinner=False)
+def build_verified_json(verified_invoices):
+    """Serialize verified invoices for JSON download (cached on list contents)"""
+    return json.dumps(verified_invoices, indent=2)
+
+@st.cache_data(show_spinner=False)
+def build_verified_csv(verified_invoices):
+    """Serialize verified invoices for CSV download without currency symbols (cached on list contents)"""
+    csv_df = pd.DataFrame.from_records(verified_invoices).reindex(columns=list(VERIFIED_DISPLAY_COLUMNS))
+    # Encode straight into bytes so only one copy is held for the download button
+    buffer = io.BytesIO()
+    csv_df.to_csv(buffer, index=False, encoding="utf-8")
+    return buffer.getvalue()
+
 def display_current_table():
     """Display current verified table rows"""
     st.markdown("---")
     st.subheader("📊 Current Verified Data")
     
     if st.session_state.verified_invoices:
-        # Prepare display data
-        display_data = []
-        for data in st.session_state.verified_invoices:
-            display_data.append({
-                "File Name": data.get("file_name", "N/A"),
-                "Invoice No": data.get("invoice_no", "N/A"),
-                "GSTIN No": data.get("gstin_no", "N/A"),
-                "Seller Name": data.get("seller_name", "N/A"),
-                "Customer Name": data.get("customer_name", "N/A"),
-                "Grand Total": f"₹{data.get('grand_total', 0):.2f}" if data.get('grand_total') else "N/A",
-                "Total GST": f"₹{data.get('total_gst', 0):.2f}" if data.get('total_gst') else "N/A",
-                "Place": data.get("place", "N/A"),
-                "Date": data.get("date", "N/A"),
-                "State": data.get("state", "N/A"),
-                "Items Count": len(data.get('items', []))
-            })
-        
         # Create DataFrame
-        df = pd.DataFrame(display_data)
+        df = build_verified_display_df(st.session_state.verified_invoices)
         
         # Display table
         st.dataframe(df, use_container_width=True)
@@ -1013,25 +1355,8 @@ def display_final_table():
         st.warning("No verified data to display")
         return
     
-    # Prepare data for display
-    display_data = []
-    for data in st.session_state.verified_invoices:
-        display_data.append({
-            "File Name": data.get("file_name", "N/A"),
-            "Invoice No": data.get("invoice_no", "N/A"),
-            "GSTIN No": data.get("gstin_no", "N/A"),
-            "Seller Name": data.get("seller_name", "N/A"),
-            "Customer Name": data.get("customer_name", "N/A"),
-            "Grand Total": f"₹{data.get('grand_total', 0):.2f}" if data.get('grand_total') else "N/A",
-            "Total GST": f"₹{data.get('total_gst', 0):.2f}" if data.get('total_gst') else "N/A",
-            "Place": data.get("place", "N/A"),
-            "Date": data.get("date", "N/A"),
-            "State": data.get("state", "N/A"),
-            "Items Count": len(data.get('items', []))
-        })
-    
     # Create DataFrame
-    df = pd.DataFrame(display_data)
+    df = build_verified_display_df(st.session_state.verified_invoices)
     
     # Display table
     st.dataframe(df, use_container_width=True)
@@ -1060,8 +1385,7 @@ def display_final_table():
         else:
             # For images, display the image
             try:
-                image = Image.open(preview_file)
-                st.image(image, caption=selected_file, use_container_width=True)
+                st.image(build_preview_thumbnail(preview_file.getvalue()), caption=selected_file, use_container_width=True)
             except Exception as e:
                 st.error(f"Could not display image: {e}")
     
@@ -1072,7 +1396,7 @@ def display_final_table():
     
     with col1:
         # JSON Download
-        json_data = json.dumps(st.session_state.verified_invoices, indent=2)
+        json_data = build_verified_json(st.session_state.verified_invoices)
         st.download_button(
             label="📄 Download JSON",
             data=json_data,
@@ -1083,23 +1407,7 @@ def display_final_table():
     with col2:
         # CSV Download
         # Prepare clean CSV data without currency symbols
-        csv_data = []
-        for data in st.session_state.verified_invoices:
-            csv_data.append({
-                "file_name": data.get("file_name", ""),
-                "invoice_no": data.get("invoice_no", ""),
-                "gstin_no": data.get("gstin_no", ""),
-                "seller_name": data.get("seller_name", ""),
-                "customer_name": data.get("customer_name", ""),
-                "grand_total": data.get("grand_total", ""),
-                "total_gst": data.get("total_gst", ""),
-                "place": data.get("place", ""),
-                "date": data.get("date", ""),
-                "state": data.get("state", "")
-            })
-        
-        csv_df = pd.DataFrame(csv_data)
-        csv_file = csv_df.to_csv(index=False)
+        csv_file = build_verified_csv(st.session_state.verified_invoices)
         
         st.download_button(
             label="📊 Download CSV",
@@ -1112,140 +1420,213 @@ def display_final_table():
     st.balloons()
     st.success(f"🎉 All {len(st.session_state.verified_invoices)} files have been processed successfully!")
 
-def extract_invoice_data(uploaded_file):
-    """Extract structured data from invoice using Gemini with enhanced validation"""
+def hash_upload(uploaded_file):
+    """SHA-256 of an upload, hashed from its buffer without copying the bytes"""
+    with uploaded_file.getbuffer() as view:
+        return hashlib.sha256(view).hexdigest()
+
+def extract_invoice_text(uploaded_file):
+    """Extract raw invoice text from an uploaded PDF (text layer) or image (OCR)
+    
+    Runs on worker threads, so it never calls Streamlit directly. Returns
+    ``(invoice_text, messages)`` where messages is a list of
+    ``(level, text)`` pairs for the caller to display.
+    """
+    messages = []
+    
     try:
-        # Save uploaded file temporarily with proper handling
-        file_extension = uploaded_file.name.split('.')[-1].lower()
-        
-        # Create a more reliable temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as tmp:
-            # Read the file content properly
-            file_content = uploaded_file.getvalue()
-            tmp.write(file_content)
-            file_path = tmp.name
-        
-        # Reset file pointer for future use
+        # Parsers read the upload in place rather than from a copy of its bytes
         uploaded_file.seek(0)
-        
         invoice_text = ""
         
-        # Extract text based on file type
+        # PDFs are read straight from memory, no temp file needed
         if uploaded_file.type == "application/pdf":
             try:
-                loader = PyPDFLoader(file_path)
-                documents = loader.load()
-                invoice_text = "\n".join([doc.page_content for doc in documents])
+                invoice_text = extract_pdf_text(uploaded_file)
             except Exception as e:
-                st.error(f"Error reading PDF {uploaded_file.name}: {e}")
-                # Clean up temp file
-                try:
-                    os.unlink(file_path)
-                except:
-                    pass
-                return None
+                messages.append(("error", f"Error reading PDF {uploaded_file.name}: {e}"))
+                return None, messages
         else:
-            # Image OCR with much better error handling
+            # Image OCR straight from the uploaded bytes, no temp files or re-encoding
             try:
-                # First, verify the file exists and is readable
-                if not os.path.exists(file_path):
-                    st.error(f"Temporary file for {uploaded_file.name} was not created properly")
-                    return None
+                import pytesseract
                 
-                # Try multiple approaches to read the image
-                try:
-                    # Approach 1: Direct open with PIL
-                    with Image.open(file_path) as img:
-                        # Convert to RGB if necessary
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        
-                        # Save to a new temporary file to ensure format consistency
-                        temp_jpg_path = file_path + "_processed.jpg"
-                        img.save(temp_jpg_path, "JPEG", quality=95)
-                        
-                        # Read the processed image
-                        with Image.open(temp_jpg_path) as processed_img:
-                            invoice_text = pytesseract.image_to_string(processed_img)
-                        
-                        # Clean up temporary processed image
-                        try:
-                            os.unlink(temp_jpg_path)
-                        except:
-                            pass
-                            
-                except Exception as img_error:
-                    # Approach 2: Try reading the original file directly
-                    try:
-                        invoice_text = pytesseract.image_to_string(file_path)
-                    except Exception as direct_error:
-                        # Approach 3: Last resort - read bytes and create image
-                        try:
-                            with open(file_path, 'rb') as f:
-                                image_bytes = f.read()
-                            image = Image.open(io.BytesIO(image_bytes))
-                            invoice_text = pytesseract.image_to_string(image)
-                        except Exception as bytes_error:
-                            st.error(f"All image processing methods failed for {uploaded_file.name}: {bytes_error}")
-                            return None
-                        
+                invoice_text = pytesseract.image_to_string(preprocess_for_ocr(uploaded_file))
             except Exception as e:
-                st.error(f"Error processing image {uploaded_file.name}: {e}")
-                # Clean up temp file
-                try:
-                    os.unlink(file_path)
-                except:
-                    pass
-                return None
-        
-        # Clean up temp file
-        try:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
-        except:
-            pass
+                messages.append(("error", f"Error processing image {uploaded_file.name}: {e}"))
+                return None, messages
         
         if not invoice_text.strip():
-            st.warning(f"No text could be extracted from {uploaded_file.name}. The image might be blurry, contain no text, or be in an unsupported format.")
-            return None
+            messages.append(("warning", f"No text could be extracted from {uploaded_file.name}. The image might be blurry, contain no text, or be in an unsupported format."))
+            return None, messages
         
-        # Prepare prompt for Gemini - Enhanced to extract items
-        prompt = create_enhanced_extraction_prompt(invoice_text)
-        
-        # Initialize Gemini
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=os.environ.get("GOOGLE_API_KEY"),
-            temperature=0.1
-        )
-        
-        # Get response from Gemini
-        response = llm.invoke(prompt)
-        
-        extracted_json = parse_gemini_response(response.content)
-        
-        # Validate and clean extracted data
-        if extracted_json:
-            extracted_json = validate_extracted_data(extracted_json, invoice_text, uploaded_file.name)
-        
-        # Format date to YYYY.MM.DD if it exists
-        if extracted_json and "date" in extracted_json:
-            date_str = extracted_json.get("date", "")
-            if date_str:
-                formatted_date = format_date_to_ymd(date_str)
-                extracted_json["date"] = formatted_date
-        
-        return extracted_json
+        return invoice_text, messages
         
     except Exception as e:
-        st.error(f"Error during extraction of {uploaded_file.name}: {str(e)}")
-        # Clean up any remaining temp files
+        messages.append(("error", f"Error during extraction of {uploaded_file.name}: {str(e)}"))
+        return None, messages
+
+def preprocess_for_ocr(image_file):
+    """Decode an uploaded invoice image as grayscale, upscaled 2x and binarized for Tesseract"""
+    try:
+        import cv2
+    except ImportError:
+        # Without OpenCV, Tesseract's own Otsu binarization handles thresholding
+        from PIL import Image
+        with Image.open(image_file) as img:
+            gray = img.convert('L')
+        return gray.resize((gray.width * 2, gray.height * 2), Image.BICUBIC)
+    
+    # Decode from a zero-copy view of the upload's buffer
+    image = cv2.imdecode(np.frombuffer(image_file.getbuffer(), np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("unsupported or corrupt image")
+    image = cv2.resize(image, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    _, image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return image
+
+# PDFium is not thread-safe, even across separate documents, and pypdfium2
+# does not serialise calls itself; extraction workers share this lock
+_PDFIUM_LOCK = threading.Lock()
+
+def extract_pdf_text(pdf_file):
+    """Read the text layer of a PDF directly from a seekable in-memory file"""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        from pypdf import PdfReader
+        reader = PdfReader(pdf_file)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(pdf_file)
         try:
-            if 'file_path' in locals() and os.path.exists(file_path):
-                os.unlink(file_path)
-        except:
-            pass
-        return None
+            texts = []
+            for i in range(len(pdf)):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_range())
+                # Close explicitly so no PDFium call is left to a finalizer outside the lock
+                textpage.close()
+                page.close()
+            return "\n".join(texts)
+        finally:
+            pdf.close()
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_llm():
+    """Create the Gemini client once per process so its HTTP connections are reused"""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=os.environ.get("GOOGLE_API_KEY"),
+        temperature=0.1
+    )
+
+# Lines worth sending to Gemini: field labels, tax terms and anything with an amount
+_RELEVANT_LINE_RE = re.compile(
+    r'invoice|inv\b|bill|gstin|gst|cgst|sgst|igst|tax|total|amount|hsn|qty|quantity|rate|'
+    r'date|place|state|supply|to\s*:|m/s|\d+\.\d{2}',
+    re.IGNORECASE
+)
+SHRINK_TEXT_MIN_CHARS = 4000
+SHRINK_CONTEXT_LINES = 2
+
+def shrink_invoice_text(invoice_text):
+    """Keep only relevant lines (plus neighbours) of long OCR text to cut prompt tokens"""
+    if len(invoice_text) < SHRINK_TEXT_MIN_CHARS:
+        return invoice_text
+    
+    lines = [line for line in invoice_text.splitlines() if line.strip()]
+    keep = [False] * len(lines)
+    for i, line in enumerate(lines):
+        if _RELEVANT_LINE_RE.search(line):
+            for j in range(max(0, i - SHRINK_CONTEXT_LINES), min(len(lines), i + SHRINK_CONTEXT_LINES + 1)):
+                keep[j] = True
+    
+    # The top of an invoice names the seller, so always keep it
+    keep[:SHRINK_CONTEXT_LINES * 2] = [True] * min(len(lines), SHRINK_CONTEXT_LINES * 2)
+    return "\n".join(line for line, kept in zip(lines, keep) if kept)
+
+def extract_invoices_batch(invoice_texts):
+    """Extract structured data for several invoice texts with a single Gemini call
+    
+    Returns ``(results, messages)`` where results holds one dict (or None)
+    per input text, in the same order. Batched results are matched to their
+    invoice by id, never by position; invoices whose id is missing or
+    repeated in the response fall back to one call each.
+    """
+    messages = []
+    results = [None] * len(invoice_texts)
+    invoice_texts = [shrink_invoice_text(text) for text in invoice_texts]
+    
+    try:
+        llm = get_gemini_llm()
+        
+        if len(invoice_texts) > 1:
+            doc_ids = [f"DOC-{n}" for n in range(1, len(invoice_texts) + 1)]
+            response = llm.invoke(create_batch_extraction_prompt(doc_ids, invoice_texts))
+            parsed = parse_gemini_response(response.content)
+            batch = parsed.get("results") if isinstance(parsed, dict) else None
+            results = match_batch_results(batch, doc_ids)
+            if None in results:
+                messages.append(("warning", "Batched AI response did not match every uploaded invoice, retrying those one by one"))
+        
+        for i, invoice_text in enumerate(invoice_texts):
+            if results[i] is not None:
+                continue
+            response = llm.invoke(create_enhanced_extraction_prompt(invoice_text))
+            data = parse_gemini_response(response.content)
+            results[i] = data if isinstance(data, dict) else None
+    
+    except Exception as e:
+        messages.append(("error", f"Error during AI extraction: {str(e)}"))
+    
+    return results, messages
+
+def finalize_extracted_data(extracted_json, invoice_text, filename):
+    """Validate AI-extracted fields against the raw text and normalise the date"""
+    # Validate and clean extracted data
+    extracted_json = validate_extracted_data(extracted_json, invoice_text, filename)
+    
+    # Format date to YYYY.MM.DD if it exists
+    date_str = extracted_json.get("date", "")
+    if date_str:
+        extracted_json["date"] = format_date_to_ymd(date_str)
+    
+    return extracted_json
+
+def create_batch_extraction_prompt(doc_ids, invoice_texts):
+    """Create a prompt asking for every invoice text at once, answered as a JSON array tagged by id"""
+    documents = "\n".join(
+        f"===INVOICE id={doc_id}===\n{text}\n" for doc_id, text in zip(doc_ids, invoice_texts)
+    )
+    
+    return create_enhanced_extraction_prompt(documents) + f"""
+    BATCH MODE:
+    The invoice text above contains {len(invoice_texts)} separate invoices, each starting with a
+    "===INVOICE id=...===" marker. Apply all of the instructions to each invoice independently.
+    Return ONLY {{"results": [...]}} where "results" holds exactly one object per invoice in the
+    format shown above, plus an "id" field copied exactly from that invoice's marker.
+    """
+
+def match_batch_results(batch, doc_ids):
+    """Map batched results back to documents by their echoed id
+    
+    Ids that are missing, unknown or repeated in the response map to None,
+    so the caller can retry just those invoices one by one.
+    """
+    by_id = {}
+    repeated = set()
+    for data in batch if isinstance(batch, list) else ():
+        if not isinstance(data, dict):
+            continue
+        doc_id = str(data.get("id", "")).strip()
+        if doc_id in by_id:
+            repeated.add(doc_id)
+        by_id[doc_id] = {key: value for key, value in data.items() if key != "id"}
+    return [None if doc_id in repeated else by_id.get(doc_id) for doc_id in doc_ids]
 
 def create_enhanced_extraction_prompt(invoice_text):
     """Create enhanced prompt for multi-invoice extraction with items data"""
@@ -1332,221 +1713,245 @@ def create_enhanced_extraction_prompt(invoice_text):
     
     return prompt
 
+# Outermost {...} block of a model response (first "{" to last "}")
+_JSON_BLOCK_RE = re.compile(r'\{.*\}', re.DOTALL)
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 def parse_gemini_response(response_text):
     """Parse Gemini response to extract JSON data"""
     try:
-        # Try to find JSON in the response
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        
-        if start_idx != -1 and end_idx != -1:
-            json_str = response_text[start_idx:end_idx]
-            return json.loads(json_str)
-        else:
-            # If no JSON found, try to parse the entire response
-            return json.loads(response_text)
-    except:
+        # Try to find JSON in the response, else parse the entire response
+        match = _JSON_BLOCK_RE.search(response_text)
+        return _json_loads(match.group(0) if match else response_text)
+    except (TypeError, ValueError):
         # Basic cleaning for common issues
         cleaned = response_text.replace('```json', '').replace('```', '').strip()
         try:
-            return json.loads(cleaned)
-        except:
-            st.error("Failed to parse AI response as JSON")
+            return _json_loads(cleaned)
+        except (TypeError, ValueError):
             return None
 
+# Fallback patterns compiled once rather than on every validated invoice
+# Invoice number labels in priority order
+_INVOICE_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'Invoice No\.?\s*:?\s*([A-Z0-9\-]+)',
+    r'Invoice Number\s*:?\s*([A-Z0-9\-]+)',
+    r'Bill No\.?\s*:?\s*([A-Z0-9\-]+)',
+    r'INV-\s*([A-Z0-9\-]+)',
+    r'Inv\.?\s*No\.?\s*:?\s*([A-Z0-9\-]+)'
+))
+_GSTIN_RE = re.compile(r'[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}[Z]{1}[0-9A-Z]{1}')
+# Grand total and GST amounts in one alternation so the text is scanned once;
+# grand1..grand4 are the grand-total labels in priority order. Optional
+# separators are written as "(?:\s*:)?" rather than "\s*:?\s*" so adjacent
+# whitespace quantifiers cannot split the same run in many ways.
+_AMOUNTS_RE = re.compile('|'.join((
+    r'Grand Total(?:\s*:)?[₹\s]*(?P<grand1>[0-9,]+\.?[0-9]*)',
+    r'Total Amount(?:\s*:)?[₹\s]*(?P<grand2>[0-9,]+\.?[0-9]*)',
+    r'Amount Payable(?:\s*:)?[₹\s]*(?P<grand3>[0-9,]+\.?[0-9]*)',
+    r'Net Amount(?:\s*:)?[₹\s]*(?P<grand4>[0-9,]+\.?[0-9]*)',
+    r'(?:Total GST|Total Tax|GST Total)(?:\s*:)?[₹\s]*(?P<total_gst>[0-9,]+\.?[0-9]*)',
+    r'CGST(?:\s*@)?\s*[0-9.%]*(?:\s*:)?[₹\s]*(?P<cgst>[0-9,]+\.?[0-9]*)',
+    r'SGST(?:\s*@)?\s*[0-9.%]*(?:\s*:)?[₹\s]*(?P<sgst>[0-9,]+\.?[0-9]*)',
+    r'IGST(?:\s*@)?\s*[0-9.%]*(?:\s*:)?[₹\s]*(?P<igst>[0-9,]+\.?[0-9]*)'
+)), re.IGNORECASE)
+_WHITESPACE_RUN_RE = re.compile(r'\s+')
+_GRAND_TOTAL_GROUPS = ('grand1', 'grand2', 'grand3', 'grand4')
+_STRIP_COMMAS = str.maketrans('', '', ',')
+_DATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'Date\s*:?\s*(\d{2}-\d{2}-\d{4})',
+    r'Date\s*:?\s*(\d{2}/\d{2}/\d{4})',
+    r'Invoice Date\s*:?\s*(\d{2}-\d{2}-\d{4})',
+    r'Bill Date\s*:?\s*(\d{2}-\d{2}-\d{4})'
+)]
+# Place names stop at the end of the line and are bounded in length
+_PLACE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'Place of Supply\s*:?\s*([A-Za-z][A-Za-z ]{0,60})',
+    r'Delivery At\s*:?\s*([A-Za-z][A-Za-z ]{0,60})',
+    r'City\s*:?\s*([A-Za-z][A-Za-z ]{0,60})'
+)]
+
+# Common Indian states for pattern matching
+INDIAN_STATES = ['Maharashtra', 'Karnataka', 'Tamil Nadu', 'Delhi', 'Uttar Pradesh',
+                 'Gujarat', 'Rajasthan', 'Punjab', 'Haryana', 'Kerala', 'West Bengal',
+                 'Andhra Pradesh', 'Telangana', 'Madhya Pradesh', 'Bihar', 'Odisha']
+_STATES_RE = re.compile(r'\b(' + '|'.join(map(re.escape, INDIAN_STATES)) + r')\b', re.IGNORECASE)
+_STATE_NAMES = {state.lower(): state for state in INDIAN_STATES}
+
+@lru_cache(maxsize=256)
+def scan_invoice_amounts(text):
+    """Collect grand-total and GST amounts from invoice text in a single pass
+    
+    Returns a dict mapping each group name of _AMOUNTS_RE to the amounts
+    found for it, in document order. The result is memoized per text, so
+    callers must not mutate it.
+    """
+    amounts = {}
+    # Collapsing whitespace runs keeps backtracking bounded on column-aligned OCR output
+    for match in _AMOUNTS_RE.finditer(_WHITESPACE_RUN_RE.sub(' ', text)):
+        try:
+            value = float(match.group(match.lastgroup).translate(_STRIP_COMMAS))
+        except ValueError:
+            continue
+        amounts.setdefault(match.lastgroup, []).append(value)
+    return amounts
+
+def find_invoice_number(text):
+    """Return the invoice number found under the highest-priority label, if any"""
+    # Searched one label at a time: in a combined alternation a lower-priority
+    # label's capture can swallow a higher-priority label that follows it
+    for pattern in _INVOICE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return match.group(1).strip()
+    return None
+
+# Fields the regex fallbacks can fill in when the AI leaves them empty
+FALLBACK_FIELDS = ("invoice_no", "gstin_no", "grand_total", "total_gst", "date", "place", "state")
+
 def validate_extracted_data(extracted_data, original_text, filename):
     """Validate and correct extracted data using fallback methods"""
     
+    # Ensure items field exists
+    if 'items' not in extracted_data:
+        extracted_data['items'] = []
+    
+    # Nothing to recover when the AI filled every field, so skip all regex passes
+    if all(extracted_data.get(field) not in (None, "", 0, "N/A") for field in FALLBACK_FIELDS):
+        return extracted_data
+    
     # Fallback extraction for critical fields
     if not extracted_data.get("invoice_no") or extracted_data.get("invoice_no") == "N/A":
         # Try direct pattern matching for invoice number
-        invoice_patterns = [
-            r'Invoice No\.?\s*:?\s*([A-Z0-9\-]+)',
-            r'Invoice Number\s*:?\s*([A-Z0-9\-]+)',
-            r'Bill No\.?\s*:?\s*([A-Z0-9\-]+)',
-            r'INV-\s*([A-Z0-9\-]+)',
-            r'Inv\.?\s*No\.?\s*:?\s*([A-Z0-9\-]+)'
-        ]
-        
-        for pattern in invoice_patterns:
-            match = re.search(pattern, original_text, re.IGNORECASE)
-            if match:
-                extracted_data["invoice_no"] = match.group(1).strip()
-                break
+        invoice_no = find_invoice_number(original_text)
+        if invoice_no:
+            extracted_data["invoice_no"] = invoice_no
     
     # Fallback for GSTIN
     if not extracted_data.get("gstin_no") or extracted_data.get("gstin_no") == "N/A":
-        gstin_pattern = r'[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}[Z]{1}[0-9A-Z]{1}'
-        match = re.search(gstin_pattern, original_text)
+        match = _GSTIN_RE.search(original_text)
         if match:
             extracted_data["gstin_no"] = match.group(0)
     
+    # Amounts for both the grand total and GST fallbacks come from one scan
+    amounts = None
+    
     # Fallback for grand total
     if not extracted_data.get("grand_total") or extracted_data.get("grand_total") == 0:
-        total_patterns = [
-            r'Grand Total\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)',
-            r'Total Amount\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)',
-            r'Amount Payable\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)',
-            r'Net Amount\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)'
-        ]
-        
-        for pattern in total_patterns:
-            match = re.search(pattern, original_text, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(',', '')
-                try:
-                    extracted_data["grand_total"] = float(amount_str)
-                    break
-                except ValueError:
-                    continue
+        amounts = scan_invoice_amounts(original_text)
+        grand_total = next((amounts[group][0] for group in _GRAND_TOTAL_GROUPS if group in amounts), None)
+        if grand_total is not None:
+            extracted_data["grand_total"] = grand_total
     
     # Fallback for total GST calculation
     if not extracted_data.get("total_gst") or extracted_data.get("total_gst") == 0:
-        total_gst = calculate_total_gst_from_text(original_text)
+        total_gst = calculate_total_gst_from_text(original_text, amounts)
         if total_gst > 0:
             extracted_data["total_gst"] = total_gst
     
     # Fallback for date
     if not extracted_data.get("date") or extracted_data.get("date") == "N/A":
-        date_patterns = [
-            r'Date\s*:?\s*(\d{2}-\d{2}-\d{4})',
-            r'Date\s*:?\s*(\d{2}/\d{2}/\d{4})',
-            r'Invoice Date\s*:?\s*(\d{2}-\d{2}-\d{4})',
-            r'Bill Date\s*:?\s*(\d{2}-\d{2}-\d{4})'
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, original_text, re.IGNORECASE)
-            if match:
+        for pattern in _DATE_PATTERNS:
+            if match := pattern.search(original_text):
                 extracted_data["date"] = match.group(1)
                 break
     
     # Fallback for place and state
     if not extracted_data.get("place") or extracted_data.get("place") == "N/A":
         # Try to extract place from address
-        place_patterns = [
-            r'Place of Supply\s*:?\s*([A-Za-z\s]+)',
-            r'Delivery At\s*:?\s*([A-Za-z\s]+)',
-            r'City\s*:?\s*([A-Za-z\s]+)'
-        ]
-        for pattern in place_patterns:
-            match = re.search(pattern, original_text, re.IGNORECASE)
-            if match:
+        for pattern in _PLACE_PATTERNS:
+            if match := pattern.search(original_text):
                 extracted_data["place"] = match.group(1).strip()
                 break
     
     if not extracted_data.get("state") or extracted_data.get("state") == "N/A":
-        # Common Indian states for pattern matching
-        states = ['Maharashtra', 'Karnataka', 'Tamil Nadu', 'Delhi', 'Uttar Pradesh', 
-                 'Gujarat', 'Rajasthan', 'Punjab', 'Haryana', 'Kerala', 'West Bengal',
-                 'Andhra Pradesh', 'Telangana', 'Madhya Pradesh', 'Bihar', 'Odisha']
-        
-        for state in states:
-            if state.lower() in original_text.lower():
-                extracted_data["state"] = state
-                break
-    
-    # Ensure items field exists
-    if 'items' not in extracted_data:
-        extracted_data['items'] = []
+        # First state named in the text, found in a single case-insensitive scan
+        if match := _STATES_RE.search(original_text):
+            extracted_data["state"] = _STATE_NAMES[match.group(1).lower()]
     
     return extracted_data
 
-def calculate_total_gst_from_text(text):
+def calculate_total_gst_from_text(text, amounts=None):
     """Calculate total GST from invoice text using multiple methods"""
-    total_gst = 0
+    if amounts is None:
+        amounts = scan_invoice_amounts(text)
     
-    try:
-        # Method 1: Look for explicit total GST
-        total_gst_patterns = [
-            r'Total GST\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)',
-            r'Total Tax\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)',
-            r'GST Total\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)'
-        ]
-        
-        for pattern in total_gst_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                amount = float(match.replace(',', ''))
-                total_gst += amount
-        
-        if total_gst > 0:
-            return total_gst
-        
-        # Method 2: Sum CGST and SGST amounts
-        cgst_pattern = r'CGST\s*@?\s*[0-9.%]*\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)'
-        sgst_pattern = r'SGST\s*@?\s*[0-9.%]*\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)'
-        
-        cgst_matches = re.findall(cgst_pattern, text, re.IGNORECASE)
-        sgst_matches = re.findall(sgst_pattern, text, re.IGNORECASE)
-        
-        for match in cgst_matches:
-            total_gst += float(match.replace(',', ''))
-        for match in sgst_matches:
-            total_gst += float(match.replace(',', ''))
-        
-        if total_gst > 0:
-            return total_gst
-        
-        # Method 3: Sum IGST amounts
-        igst_pattern = r'IGST\s*@?\s*[0-9.%]*\s*:?\s*[₹\s]*([0-9,]+\.?[0-9]*)'
-        igst_matches = re.findall(igst_pattern, text, re.IGNORECASE)
-        
-        for match in igst_matches:
-            total_gst += float(match.replace(',', ''))
-        
-    except Exception as e:
-        st.warning(f"Error calculating GST: {e}")
+    # Method 1: Look for explicit total GST
+    total_gst = sum(amounts.get('total_gst', ()))
+    if total_gst > 0:
+        return total_gst
+    
+    # Method 2: Sum CGST and SGST amounts
+    total_gst = sum(amounts.get('cgst', ())) + sum(amounts.get('sgst', ()))
+    if total_gst > 0:
+        return total_gst
+    
+    # Method 3: Sum IGST amounts
+    return sum(amounts.get('igst', ()))
+
+# Day-first, year-first and month-name-first layouts, matched after "/" and "."
+# have been normalised to "-"
+_DATE_LAYOUTS = [re.compile(pattern) for pattern in (
+    r'^(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})$',
+    r'^(?P<day>\d{1,2})[- ]+(?P<month>\d{1,2}|[A-Za-z]{3,9})[- ,]+(?P<year>\d{4}|\d{2})$',
+    r'^(?P<month>[A-Za-z]{3,9})[- ]+(?P<day>\d{1,2})[- ,]+(?P<year>\d{4}|\d{2})$',
+)]
+_MONTH_NUMBERS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12
+}
+
+def parse_date_layout(date_str):
+    """Parse a normalised date with a single regex match; returns YYYY.MM.DD or None"""
+    for pattern in _DATE_LAYOUTS:
+        match = pattern.match(date_str)
+        if match:
+            break
+    else:
+        return None
     
-    return total_gst
+    month = match.group('month')
+    month = int(month) if month.isdigit() else _MONTH_NUMBERS.get(month.lower())
+    if month is None:
+        return None
+    
+    # Two-digit years follow strptime's %y pivot
+    year = int(match.group('year'))
+    if year < 100:
+        year += 2000 if year < 69 else 1900
+    
+    try:
+        return datetime(year, month, int(match.group('day'))).strftime('%Y.%m.%d')
+    except ValueError:
+        return None
 
+@lru_cache(maxsize=4096)
 def format_date_to_ymd(date_str):
     """Convert various date formats to YYYY.MM.DD"""
     try:
         # Remove any extra spaces and common separators
         date_str = date_str.strip().replace('/', '-').replace('.', '-')
         
-        # Month mapping for text months
-        month_map = {
-            'jan': '01', 'feb': '02', 'mar': '03', 'apr': '04', 'may': '05', 'jun': '06',
-            'jul': '07', 'aug': '08', 'sep': '09', 'oct': '10', 'nov': '11', 'dec': '12',
-            'january': '01', 'february': '02', 'march': '03', 'april': '04', 'may': '05', 'june': '06',
-            'july': '07', 'august': '08', 'september': '09', 'october': '10', 'november': '11', 'december': '12'
-        }
-        
-        # Try different date formats including text months
-        formats_to_try = [
-            # Standard formats
-            '%d-%m-%Y', '%d-%m-%y', '%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y',
-            '%d.%m.%Y', '%d.%m.%y', '%Y.%m.%d',
-            
-            # Text month formats
-            '%d-%b-%Y', '%d-%B-%Y', '%d %b %Y', '%d %B %Y',
-            '%b-%d-%Y', '%B-%d-%Y', '%b %d, %Y', '%B %d, %Y',
-            '%d-%b-%y', '%d-%B-%y', '%d %b %y', '%d %B %y',
-        ]
-        
-        for fmt in formats_to_try:
-            try:
-                date_obj = datetime.strptime(date_str, fmt)
-                return date_obj.strftime('%Y.%m.%d')
-            except ValueError:
-                continue
+        # Numeric and text-month layouts (everything the old strptime format list accepted)
+        formatted = parse_date_layout(date_str)
+        if formatted:
+            return formatted
         
         # Special handling for "04-Mar-2020" type formats that might not be caught above
         try:
-            # Try to manually parse text months
-            date_lower = date_str.lower()
-            for month_text, month_num in month_map.items():
-                if month_text in date_lower:
+            # Try to manually parse text months by looking up the month token
+            parts = date_str.replace(',', ' ').replace('-', ' ').split()
+            for part in parts:
+                month_num = _MONTH_NUMBERS.get(part[:3].lower())
+                if month_num and len(parts) >= 3:
                     # Extract day and year
-                    parts = date_str.replace(',', ' ').replace('-', ' ').replace('/', ' ').split()
-                    if len(parts) >= 3:
-                        day = parts[0].zfill(2)
-                        year = parts[2]
-                        if len(year) == 2:  # Convert 2-digit year to 4-digit
-                            year = '20' + year if int(year) <= 50 else '19' + year
-                        return f"{year}.{month_num}.{day}"
+                    day = parts[0].zfill(2)
+                    year = parts[2]
+                    if len(year) == 2:  # Convert 2-digit year to 4-digit
+                        year = '20' + year if int(year) <= 50 else '19' + year
+                    return f"{year}.{month_num:02d}.{day}"
         except:
             pass
         
@@ -1556,6 +1961,67 @@ def format_date_to_ymd(date_str):
         return date_str
 
 # ==================== UPDATED MAIN APPLICATION ====================
+APP_CSS = """
+<style>
+.stApp {
+    background-color: #f8f9fa;
+    font-family: 'Segoe UI', sans-serif;
+}
+section[data-testid="stSidebar"] {
+    background-color: white;
+    border-right: 2px solid #000000;
+}
+.main-header {
+    color: #ffffff;
+    font-weight: bold;
+    text-align: center;
+    background-color: #28a745;
+    padding: 15px 0;
+    border-bottom: 2px solid #2c3e50;
+    box-shadow: 0px 2px 5px rgba(0,0,0,0.1);
+    margin-bottom: 2rem;
+}
+.stChatMessage {
+    border-radius: 12px;
+    padding: 12px;
+    margin-bottom: 8px;
+}
+.sidebar-button {
+    background-color: #218838 !important;
+    color: #ffffff !important;
+    border-radius: 8px !important;
+    font-weight: bold !important;
+    border: 2px solid #555555 !important;
+}
+.sidebar-button:hover {
+    background-color: #555555 !important;
+    color: #ffffff !important;
+}
+</style>
+"""
+
+# One markdown block per column instead of one element per line
+FEATURES_MARKDOWN = (
+    """**🧾 Multi-Invoice Extraction**
+- Multiple PDF/Image invoices
+- Batch processing
+- Manual verification mode
+- Real-time table updates
+- CSV & JSON export""",
+    """**📊 Table View**
+- Organized invoice display
+- Seller & customer info
+- Item-level details
+- Financial summaries
+- Bulk downloads with items""",
+    """**🧾 Bill Generation**
+- Create tax invoices
+- Database integration
+- Automatic HSN/GST lookup
+- PDF invoice generation
+- Professional templates""",
+)
+
 def main():
     # App configuration
     st.set_page_config(
@@ -1565,47 +2031,7 @@ def main():
     )
 
     # CSS Styling
-    st.markdown(
-        """
-        <style>
-        .stApp {
-            background-color: #f8f9fa;
-            font-family: 'Segoe UI', sans-serif;
-        }
-        section[data-testid="stSidebar"] {
-            background-color: white;
-            border-right: 2px solid #000000;
-        }
-        .main-header {
-            color: #ffffff;
-            font-weight: bold;
-            text-align: center;
-            background-color: #28a745;
-            padding: 15px 0;
-            border-bottom: 2px solid #2c3e50;
-            box-shadow: 0px 2px 5px rgba(0,0,0,0.1);
-            margin-bottom: 2rem;
-        }
-        .stChatMessage {
-            border-radius: 12px;
-            padding: 12px;
-            margin-bottom: 8px;
-        }
-        .sidebar-button {
-            background-color: #218838 !important;
-            color: #ffffff !important;
-            border-radius: 8px !important;
-            font-weight: bold !important;
-            border: 2px solid #555555 !important;
-        }
-        .sidebar-button:hover {
-            background-color: #555555 !important;
-            color: #ffffff !important;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(APP_CSS, unsafe_allow_html=True)
 
     # App header
     st.markdown('<div class="main-header"><h1>🧾 GST Invoice Analyzer</h1></div>', unsafe_allow_html=True)
@@ -1629,28 +2055,8 @@ def main():
 
     # Features showcase
     with st.expander("🚀 Supported Features"):
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.markdown("**🧾 Multi-Invoice Extraction**")
-            st.markdown("- Multiple PDF/Image invoices")
-            st.markdown("- Batch processing")
-            st.markdown("- Manual verification mode")
-            st.markdown("- Real-time table updates")
-            st.markdown("- CSV & JSON export")
-        with col2:
-            st.markdown("**📊 Table View**")
-            st.markdown("- Organized invoice display")
-            st.markdown("- Seller & customer info")
-            st.markdown("- Item-level details")
-            st.markdown("- Financial summaries")
-            st.markdown("- Bulk downloads with items")
-        with col3:
-            st.markdown("**🧾 Bill Generation**")
-            st.markdown("- Create tax invoices")
-            st.markdown("- Database integration")
-            st.markdown("- Automatic HSN/GST lookup")
-            st.markdown("- PDF invoice generation")
-            st.markdown("- Professional templates")
+        for column, features in zip(st.columns(3), FEATURES_MARKDOWN):
+            column.markdown(features)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
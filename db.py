@@ -0,0 +1,110 @@
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+# Single canonical database location, shared by the app and the setup scripts
+DB_PATH = Path(os.environ.get("GST_DB_PATH", Path(__file__).resolve().parent / "database.db"))
+
+
+def connect():
+    """Open a connection to DB_PATH with the shared per-connection pragmas"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+# Pool of ready-to-use connections. It lives here rather than in main_app.py
+# because Streamlit re-executes the entry script on every rerun, while this
+# module is imported once per process.
+DB_POOL_SIZE = 8
+_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+
+
+def _pooled_connect():
+    """New pool member; journal_mode=WAL is persisted by user_db_setup.py"""
+    conn = connect()
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+
+@contextmanager
+def get_conn():
+    """Borrow a pooled database connection and return it to the pool afterwards"""
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = _pooled_connect()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def create_invoice_tables(conn):
+    """Create the tables for saved invoice drafts"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS invoices (
+            invoice_number TEXT PRIMARY KEY,
+            gstin_number TEXT,
+            invoice_date TEXT,
+            seller_name TEXT,
+            seller_address TEXT,
+            seller_contact TEXT,
+            seller_bank TEXT,
+            buyer_name TEXT,
+            buyer_address TEXT,
+            buyer_contact TEXT,
+            buyer_gstin TEXT,
+            total_amount REAL,
+            total_gst REAL,
+            grand_total REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS invoice_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_number TEXT NOT NULL,
+            item_name TEXT,
+            hsn_code TEXT,
+            quantity REAL,
+            unit_price REAL,
+            amount REAL,
+            gst_rate TEXT,
+            gst_amount REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items(invoice_number)")
+
+
+def create_extraction_cache_table(conn):
+    """Create the table of OCR + Gemini results keyed by SHA-256 of the uploaded file bytes"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS extraction_cache (
+            content_hash TEXT PRIMARY KEY,
+            extracted_json TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def migrate_items_gst_pct(conn):
+    """Add and backfill items.rate_of_gst_pct on databases created before it existed"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(items)")]
+    if not columns:
+        return
+    if "rate_of_gst_pct" not in columns:
+        conn.execute("ALTER TABLE items ADD COLUMN rate_of_gst_pct REAL")
+    # Store GST rate as a number so lookups never parse "5%" strings
+    conn.execute("UPDATE items SET rate_of_gst_pct = CAST(REPLACE(rate_of_gst, '%', '') AS REAL) WHERE rate_of_gst_pct IS NULL")
@@ -1,28 +1,29 @@
 
 import os
+import re
 import streamlit as st
 import sqlite3
 import hashlib
-import time
-import random
-from streamlit_lottie import st_lottie
+import hmac
+from db import get_conn
 import requests
-import json
 
 # ==================== ADVANCED STYLING & ANIMATIONS ====================
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_lottie_json(url: str):
+    """Fetch Lottie JSON (cached; failures raise so they are not cached)"""
+    r = requests.get(url, timeout=3)
+    r.raise_for_status()
+    return r.json()
+
 def load_lottie_url(url: str):
     """Load Lottie animation from URL"""
     try:
-        r = requests.get(url)
-        if r.status_code != 200:
-            return None
-        return r.json()
-    except:
+        return fetch_lottie_json(url)
+    except (requests.RequestException, ValueError):
         return None
 
-def apply_advanced_styling():
-    """Apply advanced CSS styling and animations"""
-    st.markdown("""
+ADVANCED_CSS = """
     <style>
     /* Global Styles - WHITE BACKGROUND */
     .stApp {
@@ -298,60 +299,76 @@ def apply_advanced_styling():
         border-bottom: 2px solid #e0e0e0;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def apply_advanced_styling():
+    """Apply advanced CSS styling and animations (once per script run)"""
+    st.markdown(ADVANCED_CSS, unsafe_allow_html=True)
 
 # ==================== AUTHENTICATION FUNCTIONS ====================
-def init_db():
-    """Initialize database connection"""
-    return sqlite3.connect("database.db", check_same_thread=False)
+# scrypt cost parameters (~16 MB, tens of ms per hash)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+def hash_password(password, salt=None):
+    """Hash password with salted scrypt, stored as 'scrypt$n$r$p$salt$hash'"""
+    salt = salt or os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
 
-def hash_password(password):
-    """Hash password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+def check_password(password, stored_hash):
+    """Check a password against a stored scrypt or legacy SHA-256 hash"""
+    if stored_hash.startswith("scrypt$"):
+        _, n, r, p, salt, digest = stored_hash.split("$")
+        candidate = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt),
+                                   n=int(n), r=int(r), p=int(p), dklen=len(digest) // 2)
+        return hmac.compare_digest(candidate.hex(), digest)
+    # Accounts created before scrypt hold an unsalted SHA-256 digest
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
 
 def create_user(name, email, aadhaar_number, password, user_type="CA"):
     """Create new user in database"""
     try:
-        conn = init_db()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM users WHERE email = ? OR aadhaar_number = ?", 
-                      (email, aadhaar_number))
-        if cursor.fetchone():
-            return False, "User with this email or Aadhaar number already exists"
-        
         hashed_pw = hash_password(password)
-        cursor.execute(
-            "INSERT INTO users (name, email, aadhaar_number, password, user_type) VALUES (?, ?, ?, ?, ?)",
-            (name, email, aadhaar_number, hashed_pw, user_type)
-        )
-        conn.commit()
-        conn.close()
+        with get_conn() as conn:
+            # UNIQUE(email) and UNIQUE(aadhaar_number) reject duplicates atomically
+            conn.execute(
+                "INSERT INTO users (name, email, aadhaar_number, password, user_type) VALUES (?, ?, ?, ?, ?)",
+                (name, email, aadhaar_number, hashed_pw, user_type)
+            )
+            conn.commit()
         return True, "User created successfully"
+    except sqlite3.IntegrityError:
+        return False, "User with this email or Aadhaar number already exists"
     except Exception as e:
         return False, f"Error creating user: {str(e)}"
 
 def verify_user(email, password):
     """Verify user credentials"""
     try:
-        conn = init_db()
-        cursor = conn.cursor()
-        hashed_pw = hash_password(password)
-        
-        cursor.execute(
-            "SELECT id, name, email, aadhaar_number, user_type FROM users WHERE email = ? AND password = ?",
-            (email, hashed_pw)
-        )
-        user = cursor.fetchone()
-        conn.close()
+        with get_conn() as conn:
+            # Single index probe on users.email; the hash is checked in Python
+            user = conn.execute(
+                "SELECT id, name, user_type, password FROM users WHERE email = ?",
+                (email,)
+            ).fetchone()
+            
+            if user and check_password(password, user[3]):
+                # Upgrade legacy SHA-256 hashes on successful login
+                if not user[3].startswith("scrypt$"):
+                    conn.execute("UPDATE users SET password = ? WHERE id = ?",
+                                 (hash_password(password), user[0]))
+                    conn.commit()
+            else:
+                user = None
         
         if user:
             return True, {
                 'id': user[0],
                 'name': user[1],
-                'email': user[2],
-                'aadhaar_number': user[3],
-                'user_type': user[4]
+                'email': email,
+                'user_type': user[2]
             }
         else:
             return False, "Invalid email or password"
@@ -359,10 +376,16 @@ def verify_user(email, password):
         return False, f"Error verifying user: {str(e)}"
 
 # ==================== ENHANCED AUTHENTICATION PAGES ====================
+# Exactly 12 ASCII digits (str.isdigit would also accept other Unicode digits)
+_AADHAAR_RE = re.compile(r'\d{12}', re.ASCII)
+
+def set_state(**updates):
+    """Button callback: update session state before the triggered rerun renders"""
+    for key, value in updates.items():
+        st.session_state[key] = value
+
 def landing_page():
     """Enhanced landing page with advanced styling"""
-    apply_advanced_styling()
-    
     # Hero Section
     st.markdown("""
     <div class="landing-hero" style="background: linear-gradient(180deg, #2c3e50 0%, #3498db 100%);">
@@ -381,9 +404,8 @@ def landing_page():
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             st.markdown("<br>", unsafe_allow_html=True)
-            if st.button("🚀 LAUNCH APPLICATION", use_container_width=True, type="primary", key="launch_btn"):
-                st.session_state.current_page = "auth"
-                st.rerun()
+            st.button("🚀 LAUNCH APPLICATION", use_container_width=True, type="primary", key="launch_btn",
+                      on_click=set_state, kwargs={"current_page": "auth"})
         
         # Features Grid - 3 cards in one row
         st.markdown("""
@@ -405,20 +427,15 @@ def landing_page():
             </div>
         </div>
         """, unsafe_allow_html=True)
-        
-        st.markdown('</div>', unsafe_allow_html=True)
 
 
 def auth_page():
     """Enhanced authentication page with previous form design"""
-    apply_advanced_styling()
-    
     with st.container():
         
         # Back button
-        if st.button("← Back to Home", key="back_btn"):
-            st.session_state.current_page = "landing"
-            st.rerun()
+        st.button("← Back to Home", key="back_btn",
+                  on_click=set_state, kwargs={"current_page": "landing"})
         
         # Auth mode selector
         if 'auth_mode' not in st.session_state:
@@ -426,15 +443,13 @@ def auth_page():
         
         col1, col2 = st.columns(2)
         with col1:
-            if st.button("🔐 SIGN IN", use_container_width=True, 
-                        type="primary" if st.session_state.auth_mode == "signin" else "secondary"):
-                st.session_state.auth_mode = "signin"
-                st.rerun()
+            st.button("🔐 SIGN IN", use_container_width=True,
+                      type="primary" if st.session_state.auth_mode == "signin" else "secondary",
+                      on_click=set_state, kwargs={"auth_mode": "signin"})
         with col2:
-            if st.button("👤 SIGN UP", use_container_width=True,
-                        type="primary" if st.session_state.auth_mode == "signup" else "secondary"):
-                st.session_state.auth_mode = "signup"
-                st.rerun()
+            st.button("👤 SIGN UP", use_container_width=True,
+                      type="primary" if st.session_state.auth_mode == "signup" else "secondary",
+                      on_click=set_state, kwargs={"auth_mode": "signup"})
         
         st.markdown("---")
         
@@ -454,14 +469,12 @@ def auth_page():
                         st.error("❌ Please fill in all fields")
                     else:
                         with st.spinner("🔐 Authenticating..."):
-                            time.sleep(1)
                             success, result = verify_user(email, password)
                             if success:
+                                # The main app header greets the user by name
                                 st.session_state.user = result
                                 st.session_state.current_page = "main_app"
                                 st.session_state.authenticated = True
-                                st.success(f"✅ Welcome back, {result['name']}!")
-                                time.sleep(1)
                                 st.rerun()
                             else:
                                 st.error(f"❌ {result}")
@@ -486,13 +499,12 @@ def auth_page():
                         st.error("❌ Please fill in all fields")
                     elif password != confirm_password:
                         st.error("❌ Passwords do not match")
-                    elif len(aadhaar_number) != 12 or not aadhaar_number.isdigit():
+                    elif not _AADHAAR_RE.fullmatch(aadhaar_number):
                         st.error("❌ Aadhaar number must be 12 digits")
                     elif len(password) < 6:
                         st.error("❌ Password must be at least 6 characters")
                     else:
                         with st.spinner("Creating your account..."):
-                            time.sleep(1)
                             success, message = create_user(name, email, aadhaar_number, password, user_type)
                             if success:
                                 st.success("✅ Account created successfully! Please sign in.")
@@ -500,33 +512,32 @@ def auth_page():
                                 st.rerun()
                             else:
                                 st.error(f"❌ {message}")
-        
-        st.markdown("</div></div>", unsafe_allow_html=True)
 
 
 # ==================== ENHANCED MAIN APP ====================
+@st.cache_resource(show_spinner=False)
+def import_app2_module():
+    """Execute app2.py once per process and keep the module object"""
+    import importlib.util
+    
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    app2_path = os.path.join(current_dir, "app2.py")
+    
+    spec = importlib.util.spec_from_file_location("app2_module", app2_path)
+    app2_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app2_module)
+    
+    return app2_module
+
 def load_app2_functionality():
     """Import and run the main app2.py functionality"""
     try:
-        import sys
-        import importlib.util
-        
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        app2_path = os.path.join(current_dir, "app2.py")
-        
-        spec = importlib.util.spec_from_file_location("app2_module", app2_path)
-        app2_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(app2_module)
-        
-        return app2_module
+        return import_app2_module()
     except Exception as e:
         st.error(f"Error loading app functionality: {e}")
         return None
 
-def enhanced_sidebar():
-    """Enhanced sidebar with advanced styling"""
-    with st.sidebar:
-        st.markdown("""
+SIDEBAR_USER_CARD_HTML = """
         <div class="sidebar-content">
             <div class="user-card">
                 <h3>👤 {name}</h3>
@@ -537,71 +548,77 @@ def enhanced_sidebar():
                 </div>
                 <small>Profile Strength: 75%</small>
             </div>
-        """.format(
-            name=st.session_state.user['name'],
-            email=st.session_state.user['email'],
-            role=st.session_state.user['user_type']
-        ), unsafe_allow_html=True)
-        
+        """
+
+WELCOME_HEADER_HTML = """
+        <div class="main-container">
+            <div class="sidebar-gradient-header">
+                <h1 style="font-size: 2.5rem; margin-bottom: 1rem; color: white;">GST Invoice Analyzer Pro</h1>
+                <p style="font-size: 1.2rem; color: rgba(255,255,255,0.9); margin: 0;">Welcome back, <strong>{name}</strong>! Ready to streamline your invoice processing? 🚀</p>
+            </div>
+        """
+
+def cache_user_html(user):
+    """Format the per-user sidebar card and welcome header once per login"""
+    st.session_state._sidebar_html = SIDEBAR_USER_CARD_HTML.format(
+        name=user['name'],
+        email=user['email'],
+        role=user['user_type']
+    )
+    st.session_state._welcome_html = WELCOME_HEADER_HTML.format(name=user['name'])
+
+def sign_out():
+    """Sign-out callback: drop all session state except the auth mode"""
+    preserved = {key: st.session_state[key] for key in ('auth_mode',) if key in st.session_state}
+    st.session_state.clear()
+    st.session_state.update(preserved)
+    st.session_state.current_page = "landing"
+    st.session_state.authenticated = False
+
+def enhanced_sidebar():
+    """Enhanced sidebar with advanced styling"""
+    with st.sidebar:
         # Navigation - Only 3 main options
-        st.markdown("<h3 style='color: white;'>🎯 Navigation</h3>", unsafe_allow_html=True)
-        
         pages = [
             ("🧾 Multi-Invoice Extraction", "extraction"),
             ("📊 Table View & Analytics", "table"),
             ("🧾 Bill Generation", "bill")
         ]
         
+        current_nav = st.session_state.get('current_nav', 'extraction')
+        html_parts = [
+            st.session_state._sidebar_html.strip(),
+            "<h3 style='color: white;'>🎯 Navigation</h3>"
+        ]
         for page_name, page_key in pages:
-            is_active = st.session_state.get('current_nav', 'extraction') == page_key
-            active_class = "active" if is_active else ""
-            st.markdown(f"""
-            <div class="nav-card {active_class}">
-                {page_name}
-            </div>
-            """, unsafe_allow_html=True)
+            active_class = "active" if current_nav == page_key else ""
+            html_parts.append(f'<div class="nav-card {active_class}">{page_name}</div>')
+        html_parts.append("</div>")
         
-        st.markdown("</div>", unsafe_allow_html=True)
+        # User card and nav cards go out as one markdown element
+        st.markdown("\n".join(html_parts), unsafe_allow_html=True)
         
         # Sign Out Button
-        if st.button("🚪 Sign Out", use_container_width=True, key="signout_btn"):
-            for key in list(st.session_state.keys()):
-                if key not in ['current_page', 'auth_mode']:
-                    del st.session_state[key]
-            st.session_state.current_page = "landing"
-            st.session_state.authenticated = False
-            st.rerun()
+        st.button("🚪 Sign Out", use_container_width=True, key="signout_btn", on_click=sign_out)
 
 def main_app_with_auth():
     """Enhanced main application with advanced styling"""
-    apply_advanced_styling()
-    
     # Load app2 functionality
     app2 = load_app2_functionality()
     if app2 is None:
         st.error("Failed to load application functionality. Please check if app2.py exists.")
         return
     
-    # Set page config
-    st.set_page_config(
-        page_title="GST Invoice Analyzer Pro",
-        layout="wide",
-        page_icon="🧾",
-        initial_sidebar_state="expanded"
-    )
+    # User-specific HTML is formatted once per login (cleared on sign out)
+    if '_sidebar_html' not in st.session_state:
+        cache_user_html(st.session_state.user)
     
     # Enhanced Sidebar
     enhanced_sidebar()
     
     # Main Content Area - CLEAN WITH SIDEBAR GRADIENT HEADER
     with st.container():
-        st.markdown("""
-        <div class="main-container">
-            <div class="sidebar-gradient-header">
-                <h1 style="font-size: 2.5rem; margin-bottom: 1rem; color: white;">GST Invoice Analyzer Pro</h1>
-                <p style="font-size: 1.2rem; color: rgba(255,255,255,0.9); margin: 0;">Welcome back, <strong>{name}</strong>! Ready to streamline your invoice processing? 🚀</p>
-            </div>
-        """.format(name=st.session_state.user['name']), unsafe_allow_html=True)
+        st.markdown(st.session_state._welcome_html, unsafe_allow_html=True)
         
         # Navigation - Only 3 main options
         if 'current_nav' not in st.session_state:
@@ -609,20 +626,17 @@ def main_app_with_auth():
         
         nav_col1, nav_col2, nav_col3 = st.columns(3)
         with nav_col1:
-            if st.button("🧾 Extraction", use_container_width=True, 
-                        type="primary" if st.session_state.current_nav == "extraction" else "secondary"):
-                st.session_state.current_nav = "extraction"
-                st.rerun()
+            st.button("🧾 Extraction", use_container_width=True,
+                      type="primary" if st.session_state.current_nav == "extraction" else "secondary",
+                      on_click=set_state, kwargs={"current_nav": "extraction"})
         with nav_col2:
-            if st.button("📊 Table View", use_container_width=True,
-                        type="primary" if st.session_state.current_nav == "table" else "secondary"):
-                st.session_state.current_nav = "table"
-                st.rerun()
+            st.button("📊 Table View", use_container_width=True,
+                      type="primary" if st.session_state.current_nav == "table" else "secondary",
+                      on_click=set_state, kwargs={"current_nav": "table"})
         with nav_col3:
-            if st.button("🧾 Bill Generation", use_container_width=True,
-                        type="primary" if st.session_state.current_nav == "bill" else "secondary"):
-                st.session_state.current_nav = "bill"
-                st.rerun()
+            st.button("🧾 Bill Generation", use_container_width=True,
+                      type="primary" if st.session_state.current_nav == "bill" else "secondary",
+                      on_click=set_state, kwargs={"current_nav": "bill"})
         
         st.markdown("---")
         
@@ -633,12 +647,17 @@ def main_app_with_auth():
             app2.table_view_page()
         elif st.session_state.current_nav == "bill":
             app2.bill_generation_page()
-        
-        st.markdown("</div>", unsafe_allow_html=True)
 
 # ==================== MAIN APPLICATION FLOW ====================
 def main():
     """Main application flow with enhanced styling"""
+    # Page config must be the first Streamlit command of every run
+    st.set_page_config(
+        page_title="GST Invoice Analyzer Pro",
+        layout="wide",
+        page_icon="🧾",
+        initial_sidebar_state="expanded"
+    )
     
     # Initialize session state
     if 'current_page' not in st.session_state:
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("streamlit")
+app2 = pytest.importorskip("app2")
+
+
+@pytest.mark.parametrize("text, expected", [
+    # A lower-priority label directly before a higher-priority one must not swallow it
+    ("Bill No.\nInvoice No: 4521", "4521"),
+    ("Inv No.\nInvoice Number: 4521", "4521"),
+    ("Invoice Number\nInvoice No: 77", "77"),
+    ("Bill No. :\nInvoice No. GST-0091", "GST-0091"),
+    ("Bill No: B-12", "B-12"),
+    ("INV- 3301", "3301"),
+    ("no label here", None),
+])
+def test_find_invoice_number_label_priority(text, expected):
+    assert app2.find_invoice_number(text) == expected
@@ -1,27 +1,77 @@
+import csv
 import sqlite3
 import pandas as pd
+from db import DB_PATH, connect, migrate_items_gst_pct
 
 # Path to your CSV
 CSV_FILE = "data\items.csv"   # rename if needed
 
 # Connect to SQLite
-conn = sqlite3.connect("database.db")
-cursor = conn.cursor()
+conn = connect()
 
-# Read CSV
-df = pd.read_csv(CSV_FILE)
+# Rows per read_csv chunk; bounds memory for large catalogs
+CHUNK_SIZE = 10000
 
-# Normalize column names
-df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+ITEM_COLUMNS = ['hsn_code', 'category', 'item_name', 'rate_of_gst']
 
-# Insert data
-for _, row in df.iterrows():
-    cursor.execute("""
-        INSERT INTO items (hsn_code, category, item_name, rate_of_gst)
-        VALUES (?, ?, ?, ?)
-    """, (row['hsn_code'], row['category'], row['item_name'], row['rate_of_gst']))
 
-conn.commit()
+def normalize_column(name):
+    """'HSN Code ' -> 'hsn_code'"""
+    return name.strip().lower().replace(" ", "_")
+
+
+def insert_with_csv_extension(conn):
+    """Bulk-load through SQLite's csv virtual table; False if the extension is unavailable"""
+    try:
+        conn.enable_load_extension(True)
+    except AttributeError:
+        # Python built without extension loading support
+        return False
+    try:
+        conn.load_extension("csv")
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        # Only the csv module should ever be loadable on this connection
+        conn.enable_load_extension(False)
+
+    # The virtual table keeps the raw header names, so map them to ours
+    with open(CSV_FILE, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    source = {normalize_column(name): '"' + name.replace('"', '""') + '"' for name in header}
+    hsn, category, item_name, rate = (source[c] for c in ITEM_COLUMNS)
+
+    filename = CSV_FILE.replace("'", "''")
+    conn.execute(f"CREATE VIRTUAL TABLE temp.csv_src USING csv(filename='{filename}', header=YES)")
+    conn.execute(f"""
+        INSERT INTO items (hsn_code, category, item_name, rate_of_gst, rate_of_gst_pct)
+        SELECT {hsn}, {category}, {item_name}, {rate}, CAST(RTRIM(TRIM({rate}), '%') AS REAL)
+        FROM temp.csv_src
+    """)
+    conn.execute("DROP TABLE temp.csv_src")
+    return True
+
+
+def insert_with_pandas(conn):
+    """Stream the CSV with pandas and insert each chunk with executemany"""
+    for chunk in pd.read_csv(CSV_FILE, chunksize=CHUNK_SIZE):
+        chunk.columns = [normalize_column(c) for c in chunk.columns]
+
+        # Numeric GST rate, e.g. "18%" -> 18.0
+        chunk['rate_of_gst_pct'] = chunk['rate_of_gst'].astype(str).str.strip().str.strip('%').astype(float)
+
+        conn.executemany("""
+            INSERT INTO items (hsn_code, category, item_name, rate_of_gst, rate_of_gst_pct)
+            VALUES (?, ?, ?, ?, ?)
+        """, chunk[ITEM_COLUMNS + ['rate_of_gst_pct']].itertuples(index=False, name=None))
+
+
+# Load everything in one transaction, natively in SQLite when possible
+with conn:
+    migrate_items_gst_pct(conn)
+    if not insert_with_csv_extension(conn):
+        insert_with_pandas(conn)
+
 conn.close()
 
-print("✅ CSV data successfully inserted into database.db")
+print(f"✅ CSV data successfully inserted into {DB_PATH}")
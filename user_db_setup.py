@@ -1,41 +1,52 @@
 
-import sqlite3
-from pathlib import Path
-
-# Define the path for database
-BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "database.db"
+from db import DB_PATH, connect, create_extraction_cache_table, create_invoice_tables, migrate_items_gst_pct
 
 # Create connection
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
+conn = connect()
+
+# Core schema in one script. auto_vacuum only takes effect before the
+# first table exists (and before switching to WAL); WAL itself is persistent
+# in the database file. Pragmas run ahead of the transaction.
+conn.executescript("""
+PRAGMA auto_vacuum=INCREMENTAL;
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+
+BEGIN;
 
-# Create the 'users' table
-cur.execute("""
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     email TEXT UNIQUE NOT NULL,
-    aadhaar_number TEXT UNIQUE NOT NULL,
+    aadhaar_number TEXT UNIQUE NOT NULL CHECK (length(aadhaar_number) = 12),
     password TEXT NOT NULL,
     user_type TEXT DEFAULT 'CA',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-""")
+);
 
-cur.execute("""
 CREATE TABLE IF NOT EXISTS items (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     category TEXT NOT NULL,
     item_name TEXT NOT NULL,
     hsn_code TEXT NOT NULL,
-    rate_of_gst REAL NOT NULL
-)
+    rate_of_gst REAL NOT NULL,
+    rate_of_gst_pct REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_items_category ON items(category, item_name);
+CREATE INDEX IF NOT EXISTS idx_items_name_cov ON items(item_name, hsn_code, rate_of_gst);
+
+COMMIT;
 """)
 
+# Shared schema helpers from db.py (also used by app2 at startup)
+with conn:
+    create_invoice_tables(conn)
+    create_extraction_cache_table(conn)
+    # Databases created before rate_of_gst_pct existed keep their old items table
+    migrate_items_gst_pct(conn)
 
-conn.commit()
 conn.close()
 
 print(f"✅ SQLite database created at: {DB_PATH}")
-print("✅ Tables 'users' and 'items' created successfully.")
+print("✅ Tables 'users', 'items', 'invoices', 'invoice_items' and 'extraction_cache' created successfully.")